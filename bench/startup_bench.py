@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准: 从 python3 install.py 到出现第一个菜单的耗时拆解
+
+    python3 bench/startup_bench.py                # 默认跑5次,输出JSON
+    python3 bench/startup_bench.py -n 10 --cold   # 每次使用空的~/.cache,模拟首次运行
+
+每次测量都在独立的子进程中完成,网络和子进程全部打桩,可离线运行:
+- install.fetch 与 os.system 中的 wget 改为从仓库拷贝文件,/tmp/fishinstall 重定向到临时目录
+- subprocess 中的 wget/curl 命令替换为 true
+- 第一次 input() 视为到达菜单,直接结束本次测量
+
+阶段(单位秒):
+- download_base: base.py 的下载
+- import_yaml / import_distro: 第三方模块导入
+- import_base: import tools.base 本身(不含yaml/distro)
+- os_detection / arch: 重新进行一次系统版本与架构检测(使用磁盘缓存,--cold时无缓存)
+- telemetry: 使用量统计请求
+- banner: 欢迎信息与书本图案输出
+- menu: 菜单渲染到等待输入
+- time_to_menu: main()开始到等待输入的总耗时
+- tool_imports: 各 tools/tool_*.py 的导入耗时
+"""
+import argparse
+import builtins
+import glob
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+url_prefix = 'http://fishros.com/install/install1s/'
+network_cmd = re.compile(r'\b(wget|curl)\b')
+
+
+class MenuReached(Exception):
+    pass
+
+
+class Phases():
+    def __init__(self):
+        self.times = {}
+
+    def add(self,name,seconds):
+        self.times[name] = self.times.get(name,0)+seconds
+
+    def wrap(self,name,fn):
+        def wrapper(*args,**kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args,**kwargs)
+            finally:
+                self.add(name,time.perf_counter()-start)
+        return wrapper
+
+
+def fake_fetch(workdir,url,dest):
+    """把下载改为从仓库拷贝"""
+    src = os.path.join(repo_dir,url.replace(url_prefix,''))
+    if not url.startswith(url_prefix) or not os.path.isfile(src): return
+    dest = dest.replace('/tmp/fishinstall',workdir,1)
+    os.makedirs(os.path.dirname(dest),exist_ok=True)
+    shutil.copyfile(src,dest)
+
+
+def fake_wget(workdir,command):
+    """把 wget url -O path 改为从仓库拷贝"""
+    url = re.search(r'wget\s+(\S+)',command)
+    dest = re.search(r'-O\s+(\S+)',command)
+    if url and dest: fake_fetch(workdir,url.group(1),dest.group(1))
+    return 0
+
+
+def child(workdir):
+    phases = Phases()
+    shutil.copyfile(os.path.join(repo_dir,'install.py'),os.path.join(workdir,'install.py'))
+    os.chdir(workdir)
+    sys.path.insert(0,workdir)
+
+    # 网络与子进程打桩
+    os.system = lambda command: fake_wget(workdir,command)
+    real_popen_init = subprocess.Popen.__init__
+    def popen_init(self,args,*a,**kw):
+        if isinstance(args,str) and network_cmd.search(args): args = 'true'
+        real_popen_init(self,args,*a,**kw)
+    subprocess.Popen.__init__ = popen_init
+
+    def fake_input(prompt=''):
+        raise MenuReached()
+    builtins.input = fake_input
+
+    for module in ('yaml','distro'):
+        start = time.perf_counter()
+        try:
+            __import__(module)
+            phases.add('import_'+module,time.perf_counter()-start)
+        except ImportError:
+            phases.times['import_'+module] = None
+
+    # 首次导入tools.base时计时,并在导入后给CmdTask和输出打点
+    real_import = builtins.__import__
+    def timed_import(name,*args,**kwargs):
+        if name!='tools.base' or name in sys.modules: return real_import(name,*args,**kwargs)
+        start = time.perf_counter()
+        module = real_import(name,*args,**kwargs)
+        phases.add('import_base',time.perf_counter()-start)
+        base = sys.modules['tools.base']
+        real_run = base.CmdTask.run
+        def cmd_run(task):
+            start = time.perf_counter()
+            try:
+                return real_run(task)
+            finally:
+                phases.add('telemetry' if 't1733' in task.command else 'cmd_other',time.perf_counter()-start)
+        base.CmdTask.run = cmd_run
+        base.PrintUtils.print_delay = staticmethod(phases.wrap('banner',base.PrintUtils.print_delay))
+        base.ChooseWithCategoriesTask.run = phases.wrap('menu',base.ChooseWithCategoriesTask.run)
+        return module
+    builtins.__import__ = timed_import
+
+    import install
+    install.fetch = phases.wrap('download_base',lambda url,dest: fake_fetch(workdir,url,dest))
+    start = time.perf_counter()
+    try:
+        install.main()
+    except MenuReached:
+        pass
+    phases.add('time_to_menu',time.perf_counter()-start)
+    builtins.__import__ = real_import
+
+    base = sys.modules['tools.base']
+    start = time.perf_counter()
+    base.GetOsVersion().detect_os()
+    phases.add('os_detection',time.perf_counter()-start)
+    start = time.perf_counter()
+    base.SystemFacts(cache_file=os.path.join(base.cache_dir,"systemfacts.json")).arch
+    phases.add('arch',time.perf_counter()-start)
+
+    # 模拟download_tools后逐个导入工具
+    tool_imports = {}
+    for path in sorted(glob.glob(os.path.join(repo_dir,'tools','tool_*.py'))):
+        shutil.copyfile(path,os.path.join(workdir,'tools',os.path.basename(path)))
+    for path in sorted(glob.glob(os.path.join(workdir,'tools','tool_*.py'))):
+        name = 'tools.'+os.path.basename(path)[:-3]
+        start = time.perf_counter()
+        try:
+            __import__(name)
+            tool_imports[name] = time.perf_counter()-start
+        except Exception:
+            tool_imports[name] = None
+    return {'phases':phases.times,'tool_imports':tool_imports}
+
+
+def summary(values):
+    values = [v for v in values if v is not None]
+    if len(values)==0: return None
+    return {'median':statistics.median(values),'min':min(values),'max':max(values)}
+
+
+def run(runs,cold):
+    samples = []
+    for _ in range(runs):
+        workdir = tempfile.mkdtemp(prefix='fishbench')
+        env = dict(os.environ)
+        env['FISHROS_BATCH'] = '0'
+        if cold: env['HOME'] = os.path.join(workdir,'home')
+        try:
+            out = subprocess.run([sys.executable,os.path.abspath(__file__),'--child',workdir],env=env,
+                                 stdout=subprocess.PIPE,stderr=subprocess.PIPE,check=True).stdout
+        finally:
+            shutil.rmtree(workdir,ignore_errors=True)
+        # 被测程序自己的输出也在stdout,结果在最后一行
+        samples.append(json.loads(out.decode('utf-8').strip().splitlines()[-1]))
+
+    result = {'python':sys.version.split()[0],'runs':runs,'cold':cold,'phases':{},'tool_imports':{}}
+    for key in ('phases','tool_imports'):
+        names = sorted(set(name for sample in samples for name in sample[key]))
+        for name in names:
+            result[key][name] = summary([sample[key].get(name) for sample in samples])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='fishros install startup benchmark')
+    parser.add_argument('-n','--runs',type=int,default=5)
+    parser.add_argument('--cold',action='store_true',help='每次使用空的HOME,不复用磁盘缓存')
+    parser.add_argument('--child',metavar='WORKDIR',help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        result = child(args.child)
+        sys.stdout.write('\n'+json.dumps(result)+'\n')
+        return
+    print(json.dumps(run(args.runs,args.cold),indent=2))
+
+
+if __name__=='__main__':
+    main()
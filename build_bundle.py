@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+打包全部工具为单个zip,发布到 url_prefix+'tools-<sha256前16位>.zip'
+
+    python3 build_bundle.py              # 输出 ./tools-<hash>.zip
+    python3 build_bundle.py -o dist      # 输出到dist目录
+    python3 build_bundle.py --stamp      # 同时把zip的sha256写入install.py的bundle_sha256
+
+install.py只在bundle_sha256不为None时使用zip,并用这个外部的hash校验整个文件,
+所以发布新的zip时必须一起发布stamp过的install.py
+
+zip中包含:
+- tools/__init__.py: 生成的空包文件,使tools从zip中以普通包导入
+- tools/base.py 与 tools/tool_*.py
+- manifest.json: 版本号与每个文件的sha256
+
+相同的源码总是生成相同的zip(固定时间戳,按文件名排序),版本号为全部文件内容的hash
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import zipfile
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+init_source = b'# -*- coding: utf-8 -*-\n# generated by build_bundle.py\n'
+
+
+def collect():
+    files = {'tools/__init__.py':init_source}
+    for path in ['tools/base.py']+sorted(glob.glob(os.path.join(repo_dir,'tools','tool_*.py'))):
+        name = os.path.relpath(os.path.join(repo_dir,path),repo_dir).replace(os.sep,'/')
+        with open(os.path.join(repo_dir,name),'rb') as f:
+            files[name] = f.read()
+    return files
+
+
+def build(output_dir):
+    files = collect()
+    hashes = {name:hashlib.sha256(data).hexdigest() for name,data in sorted(files.items())}
+    version = hashlib.sha256(json.dumps(hashes,sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    manifest = {'version':version,'files':hashes}
+    entries = sorted(files.items())+[('manifest.json',json.dumps(manifest,indent=1,sort_keys=True).encode('utf-8'))]
+    os.makedirs(output_dir,exist_ok=True)
+    tmp = os.path.join(output_dir,'tools.zip.tmp')
+    with zipfile.ZipFile(tmp,'w',zipfile.ZIP_DEFLATED) as bundle:
+        for name,data in entries:
+            info = zipfile.ZipInfo(name,date_time=(1980,1,1,0,0,0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644<<16
+            bundle.writestr(info,data)
+    with open(tmp,'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    output = os.path.join(output_dir,'tools-{}.zip'.format(digest[:16]))
+    os.replace(tmp,output)
+    return output,digest,manifest
+
+
+def stamp(digest,path=os.path.join(repo_dir,'install.py')):
+    """把zip的sha256写入install.py"""
+    with open(path,encoding='utf-8') as f:
+        source = f.read()
+    source,count = re.subn(r"^bundle_sha256 = .*$","bundle_sha256 = '{}'".format(digest),source,count=1,flags=re.M)
+    if count!=1: raise SystemExit('bundle_sha256 not found in {}'.format(path))
+    with open(path,'w',encoding='utf-8') as f:
+        f.write(source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='build fishros tools bundle')
+    parser.add_argument('-o','--output-dir',default=repo_dir)
+    parser.add_argument('--stamp',action='store_true',help='把sha256写入install.py')
+    args = parser.parse_args()
+    output,digest,manifest = build(args.output_dir)
+    if args.stamp: stamp(digest)
+    print('{} sha256={} version={} files={}'.format(output,digest,manifest['version'],len(manifest['files'])))
+
+
+if __name__=='__main__':
+    main()
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 import os
+import sys
 
 url_prefix = 'http://fishros.com/install/install1s/'
 
 base_url = url_prefix+'tools/base.py'
+# 全部工具打包的zip,发布时由 python3 build_bundle.py --stamp 生成并写入sha256,为None时不使用
+bundle_sha256 = None
+bundle_url = url_prefix+'tools-{}.zip'
 
 INSTALL_ROS = 0  # 安装ROS相关
 INSTALL_SOFTWARE = 1  # 安装软件
@@ -33,6 +37,7 @@ tools ={
     13: {'tip':'一键配置:python国内源','type':CONFIG_TOOL,'tool':url_prefix+'tools/tool_config_python_source.py' ,'dep':[] },
     14: {'tip':'一键安装:科学上网代理工具','type':INSTALL_SOFTWARE,'tool':url_prefix+'tools/tool_install_proxy_tool.py' ,'dep':[8] },
     15: {'tip':'一键安装：QQ for Linux', 'type':INSTALL_SOFTWARE, 'tool': url_prefix+'tools/tool_install_qq.py', 'dep':[]},
+    16: {'tip':'一键离线包:导出/导入ROS离线安装包(多台机器批量安装)', 'type':INSTALL_ROS, 'tool': url_prefix+'tools/tool_bundle_ros.py', 'dep':[1,4]},
     # 77: {'tip':'测试模式:运行自定义工具测试'},
     }
 # 
@@ -51,16 +56,114 @@ for tool_id, tool_info in tools.items():
     tool_categories[tool_type][tool_id]=tool_info
 
 
+# 跨次运行保留的脚本缓存,与tools/base.py中的ScriptCache共用
+cache_dir = os.path.join(os.path.expanduser("~"),".cache","fishinstall")
+offline = os.environ.get("FISHROS_OFFLINE","0") not in ("","0")
+
+
+def fetch(url,path,ttl=600,fallback=True):
+    """
+    下载url到path,先写临时文件再替换,成功返回True
+    base.py还没有下载,这里是ScriptCache的精简版,只用标准库:
+    ttl秒内检查过的直接用缓存,否则带ETag/Last-Modified重新验证,网络不可用时用缓存,都失败时(fallback)回退到wget
+    """
+    import ssl
+    import json
+    import time
+    import hashlib
+    import urllib.error
+    import urllib.request
+
+    def write(dest,data):
+        os.makedirs(os.path.dirname(dest),exist_ok=True)
+        tmp = "{}.{}".format(dest,os.getpid())
+        with open(tmp,"wb") as f:
+            f.write(data)
+        os.replace(tmp,dest)
+
+    index_file = os.path.join(cache_dir,"index.json")
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+    except (OSError,ValueError):
+        index = {}
+    entry,data = index.get(url,{}),None
+    try:
+        with open(os.path.join(cache_dir,"objects",entry["sha256"]),"rb") as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest()!=entry["sha256"]: data = None
+    except (OSError,KeyError):
+        pass
+
+    if not offline and (data is None or time.time()-entry.get("time",0)>=ttl):
+        headers = {"User-Agent":"fishros-install"}
+        if data is not None and entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if data is not None and entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+        checked = False
+        try:
+            request = urllib.request.Request(url,headers=headers)
+            with urllib.request.urlopen(request,timeout=15,context=ssl._create_unverified_context()) as response:
+                data = response.read()
+                entry = {"sha256":hashlib.sha256(data).hexdigest(),"etag":response.headers.get("ETag"),
+                         "last_modified":response.headers.get("Last-Modified")}
+            write(os.path.join(cache_dir,"objects",entry["sha256"]),data)
+            checked = True
+        except urllib.error.HTTPError as e:
+            checked = e.code==304 and data is not None
+        except Exception:
+            pass
+        if checked:
+            entry["time"] = time.time()
+            index[url] = entry
+            try:
+                write(index_file,json.dumps(index).encode("utf-8"))
+            except OSError:
+                pass
+
+    if data is not None:
+        write(path,data)
+        return True
+    if fallback and not offline: return os.system("wget {} -O {} --no-check-certificate".format(url,path))==0
+    return False
+
+
+def load_bundle(path="/tmp/fishinstall/tools.zip"):
+    """
+    一次下载全部工具的zip,整个文件与install.py中的bundle_sha256一致时加入sys.path
+    之后tools.*直接从zip中导入,不解压;没有发布的版本或者失败时返回None,回退到逐个下载
+    """
+    import json
+    import hashlib
+    import zipfile
+    if not bundle_sha256: return None
+    # 文件名带有hash,缓存中有同样内容时不必访问网络
+    cached = os.path.join(cache_dir,"objects",bundle_sha256)
+    source = cached if os.path.exists(cached) else path
+    if source==path and not fetch(bundle_url.format(bundle_sha256[:16]),path,fallback=False): return None
+    try:
+        with open(source,"rb") as f:
+            if hashlib.sha256(f.read()).hexdigest()!=bundle_sha256: return None
+        with zipfile.ZipFile(source) as bundle:
+            manifest = json.loads(bundle.read("manifest.json").decode("utf-8"))
+    except Exception:
+        return None
+    sys.path.insert(0,source)
+    return manifest["version"]
+
+
 def main():
-    # download base
-    os.system("wget {} -O /tmp/fishinstall/{} --no-check-certificate".format(base_url,base_url.replace(url_prefix,'')))
+    # 无人值守: python3 install.py --plan fish_plan.yaml,等价于环境变量FISHROS_PLAN=fish_plan.yaml
+    if "--plan" in sys.argv[:-1]: os.environ["FISHROS_PLAN"] = os.path.abspath(sys.argv[sys.argv.index("--plan")+1])
+    # download tools bundle, fallback to base
+    if not load_bundle():
+        fetch(base_url,"/tmp/fishinstall/{}".format(base_url.replace(url_prefix,'')))
     from tools.base import CmdTask,FileUtils,PrintUtils,ChooseTask,ChooseWithCategoriesTask
     from tools.base import encoding_utf8,osversion,osarch
-    from tools.base import run_tool_file,download_tools
-    from tools.base import config_helper
+    from tools.base import run_tool_file,ToolScheduler
+    from tools.base import config_helper,install_plan
     # PrintUtils.print_delay(f"检测到你的系统版本信息为{osversion.get_codename()},{osarch}",0.001)
     # 使用量统计
-    CmdTask("wget https://fishros.org.cn/forum/topic/1733 -O /tmp/t1733 -q && rm -rf /tmp/t1733").run()
+    if not offline: CmdTask("wget https://fishros.org.cn/forum/topic/1733 -O /tmp/t1733 -q && rm -rf /tmp/t1733").run()
 
     # check base config
     if not encoding_utf8:
@@ -73,6 +176,11 @@ def main():
         return False
     PrintUtils.print_success("基础检查通过...")
 
+    if install_plan.active:
+        ok = install_plan.execute(tools,url_prefix)
+        config_helper.gen_config_file()
+        return ok
+
     book = """
                         .-~~~~~~~~~-._       _.-~~~~~~~~~-.
                     __.'              ~.   .~              `.__
@@ -110,8 +218,11 @@ def main():
         print(tools[code]['tool'].replace(url_prefix,'').replace("/","."))
         run_tool_file(tools[code]['tool'].replace(url_prefix,'').replace("/","."))
     else: 
-        download_tools(code,tools)
-        run_tool_file(tools[code]['tool'].replace(url_prefix,'').replace("/","."))
+        # 并行下载工具及其全部依赖,下载完成后运行
+        scheduler = ToolScheduler(tools,url_prefix)
+        scheduler.plan(code,run=True)
+        scheduler.execute()
+        scheduler.summary()
 
     config_helper.gen_config_file()
     PrintUtils.print_delay("欢迎加入机器人学习交流QQ群：438144612(入群口令：一键安装)",0.1)
@@ -119,4 +230,4 @@ def main():
     PrintUtils.print_success("如在使用过程中遇到问题，请打开：https://fishros.org.cn/forum 进行反馈",0.001)
 
 if __name__=='__main__':
-    main()
\ No newline at end of file
+    if main()==False: sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+测试用的本地http.server
+- files: {路径:内容},响应带ETag,支持If-None-Match返回304
+- 支持单段Range请求,no_range中的路径忽略Range
+- truncate: {路径:字节数},声明完整的Content-Length但只发送前n个字节后断开
+- delay: {路径:秒},响应前等待
+- requests: 记录每个请求的(客户端端口,路径,Range)
+"""
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self,format,*args):
+        pass
+
+    def _empty(self,code,headers={}):
+        self.send_response(code)
+        for key,value in headers.items(): self.send_header(key,value)
+        self.send_header("Content-Length","0")
+        self.end_headers()
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.client_address[1],self.path,self.headers.get("Range")))
+        time.sleep(server.delay.get(self.path,0))
+        data = server.files.get(self.path)
+        if data is None: return self._empty(404)
+        etag = '"{}"'.format(hashlib.sha256(data).hexdigest()[:16])
+        if self.headers.get("If-None-Match")==etag: return self._empty(304,{"ETag":etag})
+        start,end = 0,len(data)-1
+        ranged = self.headers.get("Range") and self.path not in server.no_range
+        if ranged:
+            first,last = self.headers["Range"].split("=",1)[1].split("-")
+            start,end = int(first),min(int(last) if last else len(data)-1,len(data)-1)
+            self.send_response(206)
+            self.send_header("Content-Range","bytes {}-{}/{}".format(start,end,len(data)))
+        else:
+            self.send_response(200)
+        body = data[start:end+1]
+        self.send_header("ETag",etag)
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        if self.path in server.truncate and not ranged:
+            self.wfile.write(body[:server.truncate[self.path]])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class LocalServer():
+    def __init__(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1",0),Handler)
+        self.httpd.daemon_threads = True
+        self.files = self.httpd.files = {}
+        self.no_range = self.httpd.no_range = set()
+        self.truncate = self.httpd.truncate = {}
+        self.delay = self.httpd.delay = {}
+        self.requests = self.httpd.requests = []
+        self.thread = threading.Thread(target=self.httpd.serve_forever,daemon=True)
+
+    def url(self,path):
+        return "http://127.0.0.1:{}{}".format(self.httpd.server_address[1],path)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tools.base import Downloader
+from tests.httpserver import LocalServer
+
+
+class DownloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(300*1024+7)
+        self.server = LocalServer().start()
+        self.server.files["/file.bin"] = self.data
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir,"file.bin")
+        self.downloader = Downloader(segments=4,timeout=5,retry=1,retry_delay=0)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def ranges(self):
+        return [r for _,path,r in self.server.requests if path=="/file.bin" and r and r!="bytes=0-0"]
+
+    def read(self):
+        with open(self.path,"rb") as f:
+            return f.read()
+
+    def test_segments(self):
+        self.assertTrue(self.downloader.download(self.server.url("/file.bin"),self.path))
+        self.assertEqual(self.read(),self.data)
+        self.assertEqual(len(self.ranges()),4)
+        self.assertFalse(os.path.exists(self.path+".part"))
+        self.assertFalse(os.path.exists(self.path+".part.json"))
+
+    def test_resume(self):
+        # 模拟上次下载中断:每段都只下载了一半
+        size = len(self.data)
+        step = -(-size//4)
+        segments = [[i,min(i+step,size)-1,0] for i in range(0,size,step)]
+        with open(self.path+".part","wb") as f:
+            f.write(b"\0"*size)
+            for segment in segments:
+                segment[2] = (segment[1]-segment[0]+1)//2
+                f.seek(segment[0])
+                f.write(self.data[segment[0]:segment[0]+segment[2]])
+        etag = '"{}"'.format(hashlib.sha256(self.data).hexdigest()[:16])
+        with open(self.path+".part.json","w") as f:
+            json.dump({"url":self.server.url("/file.bin"),"size":size,"validator":etag,"segments":segments},f)
+
+        self.assertTrue(self.downloader.download(self.server.url("/file.bin"),self.path))
+        self.assertEqual(self.read(),self.data)
+        starts = sorted(int(r.split("=")[1].split("-")[0]) for r in self.ranges())
+        self.assertEqual(starts,[segment[0]+segment[2] for segment in segments])
+
+    def test_sha256(self):
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.assertTrue(self.downloader.download(self.server.url("/file.bin"),self.path,sha256=digest.upper()))
+        self.assertEqual(self.read(),self.data)
+
+    def test_sha256_mismatch(self):
+        self.assertFalse(self.downloader.download(self.server.url("/file.bin"),self.path,sha256="0"*64))
+        self.assertEqual(os.listdir(self.dir),[])
+
+    def test_sha256_url(self):
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.server.files["/SHASUMS256.txt"] = "{}  other.bin\n{}  file.bin\n".format("1"*64,digest).encode()
+        self.assertTrue(self.downloader.download(self.server.url("/file.bin"),self.path,sha256_url=self.server.url("/SHASUMS256.txt")))
+        os.remove(self.path)
+        self.server.files["/SHASUMS256.txt"] = "{}  file.bin\n".format("1"*64).encode()
+        self.assertFalse(self.downloader.download(self.server.url("/file.bin"),self.path,sha256_url=self.server.url("/SHASUMS256.txt")))
+        self.assertEqual(os.listdir(self.dir),[])
+
+    def test_without_range(self):
+        self.server.no_range.add("/file.bin")
+        self.assertTrue(self.downloader.download(self.server.url("/file.bin"),self.path))
+        self.assertEqual(self.read(),self.data)
+
+    def test_truncated(self):
+        # 不支持Range的服务器中途断开,文件比Content-Length短
+        self.server.no_range.add("/file.bin")
+        self.server.truncate["/file.bin"] = 1000
+        self.assertFalse(self.downloader.download(self.server.url("/file.bin"),self.path))
+        self.assertEqual(os.listdir(self.dir),[])
+
+
+if __name__=="__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from tools.base import MirrorProber
+from tests.httpserver import LocalServer
+
+
+class MirrorProberTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer().start()
+        for name in ("fast","slow"):
+            self.server.files["/{}/dists/jammy/InRelease".format(name)] = b"Origin: test\n"*10
+            self.server.files["/{}/Packages.gz".format(name)] = os.urandom(64*1024)
+        self.server.delay["/slow/dists/jammy/InRelease"] = 0.3
+        self.dir = tempfile.mkdtemp()
+        self.prober = MirrorProber(cache_file=os.path.join(self.dir,"mirrors.json"),timeout=3,sample_size=16*1024)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def candidates(self):
+        return {name:(self.server.url("/{}/dists/jammy/InRelease".format(name)),self.server.url("/{}/Packages.gz".format(name)))
+                for name in ("missing","slow","fast")}
+
+    def test_rank(self):
+        ranked = self.prober.rank(self.candidates())
+        self.assertEqual([name for name,_ in ranked],["fast","slow","missing"])
+        scores = dict(ranked)
+        self.assertTrue(scores["fast"]["ok"])
+        self.assertGreater(scores["fast"]["throughput"],0)
+        self.assertGreaterEqual(scores["slow"]["latency"],0.3)
+        self.assertFalse(scores["missing"]["ok"])
+        # 样本只下载sample_size字节
+        self.assertIn(("/fast/Packages.gz","bytes=0-{}".format(16*1024-1)),[(path,r) for _,path,r in self.server.requests])
+
+    def test_cache(self):
+        self.prober.rank(self.candidates())
+        count = len(self.server.requests)
+        ranked = self.prober.rank(self.candidates())
+        self.assertEqual(len(self.server.requests),count)
+        self.assertEqual(ranked[0][0],"fast")
+        self.prober.rank(self.candidates(),use_cache=False)
+        self.assertGreater(len(self.server.requests),count)
+
+    def test_ttl(self):
+        self.prober.rank(self.candidates())
+        count = len(self.server.requests)
+        self.prober.ttl = -1
+        self.prober.rank(self.candidates())
+        self.assertGreater(len(self.server.requests),count)
+
+
+if __name__=="__main__":
+    unittest.main()
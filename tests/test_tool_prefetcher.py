@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from tools.base import ScriptCache,ToolPrefetcher
+from tests.httpserver import LocalServer
+
+
+class ToolPrefetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer().start()
+        for i in range(3):
+            self.server.files["/tools/tool_{}.py".format(i)] = "# tool {}\n".format(i).encode()
+        self.dir = tempfile.mkdtemp()
+        self.cache = ScriptCache(os.path.join(self.dir,"cache"),ttl=0)
+        self.cache.offline = False
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def target(self,i):
+        return os.path.join(self.dir,"tools","tool_{}.py".format(i))
+
+    def read(self,path):
+        with open(path,"rb") as f:
+            return f.read()
+
+    def fetch_all(self,prefetcher):
+        return [prefetcher.fetch(self.server.url("/tools/tool_{}.py".format(i)),self.target(i)) for i in range(3)]
+
+    def test_keep_alive(self):
+        self.assertEqual(self.fetch_all(ToolPrefetcher()),[True]*3)
+        for i in range(3):
+            self.assertEqual(self.read(self.target(i)),"# tool {}\n".format(i).encode())
+        # 同一个线程的三次请求复用同一个连接
+        self.assertEqual(len(set(port for port,_,_ in self.server.requests)),1)
+
+    def test_missing(self):
+        self.assertFalse(ToolPrefetcher(retry=0).fetch(self.server.url("/tools/none.py"),self.target(9)))
+        self.assertFalse(os.path.exists(self.target(9)))
+
+    def test_conditional_get(self):
+        prefetcher = ToolPrefetcher(cache=self.cache)
+        self.assertEqual(self.fetch_all(prefetcher),[True]*3)
+        os.remove(self.target(0))
+        self.server.requests.clear()
+        # ttl=0,每次都带If-None-Match重新验证,未变化时服务端返回304,内容来自缓存
+        self.assertTrue(prefetcher.fetch(self.server.url("/tools/tool_0.py"),self.target(0)))
+        self.assertEqual(self.read(self.target(0)),b"# tool 0\n")
+        self.assertEqual(len(self.server.requests),1)
+        # 服务端内容变化后重新下载
+        self.server.files["/tools/tool_0.py"] = b"# tool 0 v2\n"
+        self.assertTrue(prefetcher.fetch(self.server.url("/tools/tool_0.py"),self.target(0)))
+        self.assertEqual(self.read(self.target(0)),b"# tool 0 v2\n")
+
+    def test_cache_fallback(self):
+        prefetcher = ToolPrefetcher(retry=0,cache=self.cache)
+        self.fetch_all(prefetcher)
+        url = self.server.url("/tools/tool_1.py")
+        self.server.stop()
+        os.remove(self.target(1))
+        # 网络不可用时使用缓存中的旧版本
+        self.assertTrue(prefetcher.fetch(url,self.target(1)))
+        self.assertEqual(self.read(self.target(1)),b"# tool 1\n")
+        # 离线模式不访问网络,缓存中没有的脚本直接失败
+        self.cache.offline = True
+        self.assertTrue(prefetcher.fetch(url,self.target(1)))
+        self.assertFalse(prefetcher.fetch(url.replace("tool_1","tool_9"),self.target(9)))
+
+
+if __name__=="__main__":
+    unittest.main()
@@ -4,11 +4,41 @@ from __future__ import print_function
 from calendar import c
 import os
 import re
+import atexit
+import traceback
 import sys
 import time
+import codecs
+import signal
+import gzip
+import shutil
+import itertools
+import threading
+import unicodedata
+import selectors
 import subprocess
 import locale
+import json
+import glob
+import pwd
+import getpass
+import platform
+import hashlib
+import ssl
+import http.client
+import urllib.parse
+import urllib.request
+import concurrent.futures
+import contextlib
+import fcntl
+import struct
+import pty
+import tty
+import termios
+import zipfile
+import zipimport
 from queue import Queue
+from collections import deque
 #TODO try import! failed skip
 have_yaml_module = False
 try:
@@ -20,6 +50,9 @@ except:
 encoding = locale.getpreferredencoding()
 encoding_utf8 = encoding.find("UTF")>-1
 
+# 跨次运行保留的缓存目录
+cache_dir = os.path.join(os.path.expanduser("~"),".cache","fishinstall")
+
 
 class ConfigHelper():
     def __init__(self,record_file=None):
@@ -43,6 +76,8 @@ class ConfigHelper():
             chooses.append(self.record_input_queue.get())
 
         config_yaml['chooses'] = chooses
+        # 带key的选择同时按key记录,可以直接作为安装计划的answers
+        config_yaml['answers'] = {item['key']:item['choose'] for item in chooses if item.get('key')}
         config_yaml['time'] = str(time.time())
 
         with open("/tmp/fish_install.yaml", "w", encoding="utf-8") as f:
@@ -83,8 +118,6 @@ class ConfigHelper():
         else:
             config_yaml = yaml.load(config_data)
 
-        for choose in config_yaml['chooses']:
-            choose_queue.put(choose)
         for choose in config_yaml['chooses']:
             choose_queue.put(choose)
 
@@ -92,26 +125,168 @@ class ConfigHelper():
 
 config_helper = ConfigHelper()
 
+
+class PlanError(Exception):
+    pass
+
+
+class InstallPlan():
+    """
+    无人值守安装计划,用于批量部署,通过 install.py --plan <文件> 或环境变量FISHROS_PLAN指定
+
+        tools: [1]                          # 依次运行的工具,install.py中的编号
+        answers:                            # 按提示的key回答,值可以是选项编号、选项名或选项文字
+          ros.version: humble
+          ros.flavor: desktop
+          source.mode: clean
+        report: /tmp/fish_install_report.json
+
+    - 计划中没有回答的提示直接失败(PlanError),不会卡在input()
+    - 任一工具失败后不再运行后面的工具
+    - 结束后把每个步骤的耗时和所有回答写入report
+    """
+    def __init__(self,path=None) -> None:
+        self.path = path
+        self.tools = []
+        self.answers = {}
+        self.report_file = "/tmp/fish_install_report.json"
+        self.records = []
+        self.steps = []
+        if path: self.load(path)
+
+    @property
+    def active(self):
+        return bool(self.path)
+
+    @staticmethod
+    def flatten(data,prefix=""):
+        """{ros:{version:humble}}与{ros.version:humble}等价"""
+        result = {}
+        for key,value in (data or {}).items():
+            if isinstance(value,dict): result.update(InstallPlan.flatten(value,prefix+str(key)+"."))
+            else: result[prefix+str(key)] = value
+        return result
+
+    def load(self,path):
+        with open(path,"r",encoding="utf-8") as f:
+            data = f.read()
+        if path.endswith(".json") or not have_yaml_module: plan = json.loads(data)
+        else: plan = yaml.safe_load(data)
+        self.tools = [int(id) for id in plan.get("tools",[])]
+        self.answers = InstallPlan.flatten(plan.get("answers"))
+        self.report_file = plan.get("report",self.report_file)
+
+    @staticmethod
+    def match(value,dic,names=None):
+        """返回value对应的选项编号,没有匹配时为None"""
+        # yaml会把yes/no解析为布尔值
+        if isinstance(value,bool): value = "yes" if value else "no"
+        value = str(value).strip()
+        if value.isdecimal() and int(value) in dic: return int(value)
+        for choose,name in (names or {}).items():
+            if name==value: return choose
+        for choose,desc in dic.items():
+            desc = str(desc)
+            # humble可以匹配选项humble(ROS2)
+            if value.lower() in (desc.lower(),re.split(r"[^0-9A-Za-z_\-]",desc)[0].lower()): return choose
+        return None
+
+    def answer(self,key,dic,names=None,tips=""):
+        """回答选择提示,返回选项编号"""
+        if not key: raise PlanError("该提示没有key,无法从安装计划中回答:{}".format(tips))
+        if key not in self.answers: raise PlanError("安装计划中没有回答{}:{}".format(key,tips))
+        choose = InstallPlan.match(self.answers[key],dic,names)
+        if choose is None:
+            raise PlanError("安装计划中{}={}不在可选项中:{}".format(key,self.answers[key],list(dic.values())))
+        self.records.append({"key":key,"value":self.answers[key],"choose":choose,"desc":str(dic[choose])})
+        return choose
+
+    def ask(self,key,tips="",default=None):
+        """回答输入提示,没有回答时使用default"""
+        if key and key in self.answers: value = str(self.answers[key])
+        elif default is not None: value = default
+        else: raise PlanError("安装计划中没有回答{}:{}".format(key,tips))
+        self.records.append({"key":key,"value":value})
+        return value
+
+    def require_interactive(self,tips):
+        """后面的步骤必须由人操作(如aptitude选择解决方案),执行计划时直接失败"""
+        if self.active: raise PlanError("需要手动操作,无人值守安装无法继续:{}".format(tips))
+
+    def execute(self,tools,url_prefix):
+        """依次运行计划中的工具,全部成功返回True"""
+        start,ok,error = time.time(),True,None
+        for id in self.tools:
+            if id not in tools:
+                ok,error = False,"工具{}不存在".format(id)
+                break
+            scheduler = ToolScheduler(tools,url_prefix)
+            scheduler.plan(id,run=True)
+            ok = scheduler.execute()
+            scheduler.summary()
+            for name,step in scheduler.steps.items():
+                self.steps.append({"tool":id,"name":name,"result":step["result"],"error":step.get("error"),
+                                   "traceback":step.get("traceback"),
+                                   "start":step["start"] and step["start"]-start,
+                                   "duration":step["end"] and step["end"]-step["start"]})
+                if step.get("error"): error = step["error"]
+            if not ok: break
+        self.write_report(start,ok,error)
+        return ok
+
+    def write_report(self,start,ok,error):
+        report = {"plan":self.path,"ok":ok,"error":error,"duration":time.time()-start,"steps":self.steps,"answers":self.records}
+        try:
+            with open(self.report_file,"w",encoding="utf-8") as f:
+                json.dump(report,f,ensure_ascii=False,indent=1)
+            PrintUtils.print_info("安装报告已写入{}".format(self.report_file))
+        except OSError as e:
+            PrintUtils.print_error("安装报告写入失败:{}".format(e))
+
+install_plan = InstallPlan(os.environ.get("FISHROS_PLAN"))
+
 def GetOsVersion():
     """
     Library for detecting the current OS, including detecting specific
     Linux distributions.
     """
     import codecs
-    # to be removed after Ubuntu Xenial is out of support
-    import sys
-    # @TODO 系统的python版本小于3.8，Conda版本>3.8
-    if sys.version_info >= (3, 8):
-        import distro
-    else:
-        import platform as distro
+    import json
     import locale
     import os
     import platform
     import subprocess
 
+    # 系统信息文件只解析一次
+    _parsed = {}
+
+    def _memoize(key,fn):
+        if key not in _parsed: _parsed[key] = fn()
+        return _parsed[key]
+
+    def _get_distro():
+        # to be removed after Ubuntu Xenial is out of support
+        # @TODO 系统的python版本小于3.8，Conda版本>3.8
+        if sys.version_info >= (3, 8):
+            import distro
+        else:
+            import platform as distro
+        return distro
+
+    def _read_lsb_info():
+        def read():
+            distro = _get_distro()
+            if hasattr(distro, "linux_distribution"):
+                return distro.linux_distribution(full_distribution_name=0)
+            elif hasattr(distro, "dist"):
+                return distro.dist()
+            return None
+        return _memoize(("lsb",),read)
 
     def _read_stdout(cmd):
+        return _memoize(("cmd",)+tuple(cmd),lambda: _read_stdout_uncached(cmd))
+
+    def _read_stdout_uncached(cmd):
         try:
             pop = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             (std_out, std_err) = pop.communicate()
@@ -134,6 +309,9 @@ def GetOsVersion():
         """
         :returns: list of strings in issue file, or None if issue file cannot be read/split
         """
+        return _memoize(("issue",filename),lambda: _read_issue(filename))
+
+    def _read_issue(filename):
         if os.path.exists(filename):
             with codecs.open(filename, 'r', encoding=locale.getpreferredencoding()) as f:
                 return f.read().split()
@@ -150,6 +328,9 @@ def GetOsVersion():
             if not os.path.exists(filename):
                 filename = '/usr/lib/os-release'
 
+        return _memoize(("os-release",filename),lambda: _read_os_release(filename))
+
+    def _read_os_release(filename):
         if not os.path.exists(filename):
             return None
 
@@ -201,12 +382,7 @@ def GetOsVersion():
         """
         def __init__(self, lsb_name, get_version_fn=None):
             self.lsb_name = lsb_name
-            if hasattr(distro, "linux_distribution"):
-                self.lsb_info = distro.linux_distribution(full_distribution_name=0)
-            elif hasattr(distro, "dist"):
-                self.lsb_info = distro.dist()
-            else:
-                self.lsb_info = None
+            self.lsb_info = _read_lsb_info()
 
         def is_os(self):
             if self.lsb_info is None:
@@ -575,6 +751,32 @@ def GetOsVersion():
             raise OsNotDetected('called in incorrect OS')
 
 
+    class LazyDetector(OsDetector):
+        """
+        Create the wrapped detector on first use, so registering all
+        detectors does not read any system files.
+        """
+        def __init__(self, detector_class, *args, **kwargs):
+            self._detector_class = detector_class
+            self._args = args
+            self._kwargs = kwargs
+            self._detector = None
+
+        def get_detector(self):
+            if self._detector is None:
+                self._detector = self._detector_class(*self._args, **self._kwargs)
+            return self._detector
+
+        def is_os(self):
+            return self.get_detector().is_os()
+
+        def get_version(self):
+            return self.get_detector().get_version()
+
+        def get_codename(self):
+            return self.get_detector().get_codename()
+
+
     class OsDetect:
         """
         This class will iterate over registered classes to lookup the
@@ -582,6 +784,9 @@ def GetOsVersion():
         """
 
         default_os_list = []
+        # 结果缓存,系统信息文件修改后失效
+        cache_file = os.path.join(cache_dir, "osversion.json")
+        cache_sources = ['/etc/os-release', '/usr/lib/os-release', '/etc/lsb-release', '/etc/issue', '/etc/debian_version']
 
         def __init__(self, os_list=None):
             if os_list is None:
@@ -594,29 +799,69 @@ def GetOsVersion():
             self._override = False
 
         @staticmethod
-        def register_default(os_name, os_detector):
+        def register_default(os_name, os_detector, *args, **kwargs):
             """
             Register detector to be used with all future instances of
             :class:`OsDetect`.  The new detector will have precedence over
             any previously registered detectors associated with *os_name*.
 
             :param os_name: OS key associated with OS detector
-            :param os_detector: :class:`OsDetector` instance
+            :param os_detector: :class:`OsDetector` instance, or an
+              :class:`OsDetector` class that is created lazily with *args*
             """
+            if isinstance(os_detector, type):
+                os_detector = LazyDetector(os_detector, *args, **kwargs)
             OsDetect.default_os_list.insert(0, (os_name, os_detector))
 
-        def detect_os(self, env=None):
+        @staticmethod
+        def _cache_key():
+            key = {}
+            for path in OsDetect.cache_sources:
+                try:
+                    key[path] = os.stat(path).st_mtime
+                except OSError:
+                    key[path] = None
+            return key
+
+        def _load_cache(self):
+            try:
+                with open(OsDetect.cache_file, "r") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                return None
+            if data.get("key") != OsDetect._cache_key():
+                return None
+            return data.get("result")
+
+        def _save_cache(self):
+            try:
+                os.makedirs(os.path.dirname(OsDetect.cache_file), exist_ok=True)
+                tmp = "{}.{}".format(OsDetect.cache_file, os.getpid())
+                with open(tmp, "w") as f:
+                    json.dump({"key": OsDetect._cache_key(), "result": [self._os_name, self._os_version, self._os_codename]}, f)
+                os.replace(tmp, OsDetect.cache_file)
+            except OSError:
+                pass
+
+        def detect_os(self, env=None, use_cache=True):
             """
             Detect operating system.  Return value can be overridden by
             the :env:`ROS_OS_OVERRIDE` environment variable.
 
             :param env: override ``os.environ``
+            :param use_cache: reuse the result cached on disk if the os
+              release files did not change
             :returns: (os_name, os_version, os_codename), ``(str, str, str)``
             :raises: :exc:`OsNotDetected` if OS could not be detected
             """
             if env is None:
                 env = os.environ
-            if 'ROS_OS_OVERRIDE' in env:
+            cached = None
+            if use_cache and 'ROS_OS_OVERRIDE' not in env and self._os_list is OsDetect.default_os_list:
+                cached = self._load_cache()
+            if cached:
+                self._os_name, self._os_version, self._os_codename = cached
+            elif 'ROS_OS_OVERRIDE' in env:
                 splits = env["ROS_OS_OVERRIDE"].split(':')
                 self._os_name = splits[0]
                 if len(splits) > 1:
@@ -636,6 +881,8 @@ def GetOsVersion():
                         self._os_codename = os_detector.get_codename()
                         self._os_detector = os_detector
                         break
+                if self._os_name and self._os_list is OsDetect.default_os_list:
+                    self._save_cache()
 
             if self._os_name:
                 return self._os_name, self._os_version, self._os_codename
@@ -651,7 +898,7 @@ def GetOsVersion():
             """
             if name is None:
                 if not self._os_detector:
-                    self.detect_os()
+                    self.detect_os(use_cache=False)
                 return self._os_detector
             else:
                 try:
@@ -727,46 +974,46 @@ def GetOsVersion():
     OS_WINDOWS = 'windows'
     OS_ZORIN =  'zorin'
 
-    OsDetect.register_default(OS_ALMALINUX, FdoDetect("almalinux"))
-    OsDetect.register_default(OS_ALPINE, FdoDetect("alpine"))
-    OsDetect.register_default(OS_AMAZON, FdoDetect("amzn"))
-    OsDetect.register_default(OS_ARCH, Arch())
-    OsDetect.register_default(OS_BUILDROOT, FdoDetect("buildroot"))
-    OsDetect.register_default(OS_MANJARO, Manjaro())
-    OsDetect.register_default(OS_CENTOS, FdoDetect("centos"))
-    OsDetect.register_default(OS_EULEROS, FdoDetect("euleros"))
-    OsDetect.register_default(OS_CYGWIN, Cygwin())
-    OsDetect.register_default(OS_DEBIAN, Debian())
-    OsDetect.register_default(OS_ELEMENTARY, LsbDetect("elementary"))
-    OsDetect.register_default(OS_ELEMENTARY_OLD, LsbDetect("elementary OS"))
-    OsDetect.register_default(OS_FEDORA, FdoDetect("fedora"))
-    OsDetect.register_default(OS_FREEBSD, FreeBSD())
-    OsDetect.register_default(OS_FUNTOO, Funtoo())
-    OsDetect.register_default(OS_GENTOO, Gentoo())
-    OsDetect.register_default(OS_LINARO, LsbDetect("Linaro"))
-    OsDetect.register_default(OS_MINT, LsbDetect("LinuxMint"))
-    OsDetect.register_default(OS_MX, LsbDetect("MX"))
-    OsDetect.register_default(OS_NEON, LsbDetect("neon"))
-    OsDetect.register_default(OS_OPENEMBEDDED, OpenEmbedded())
-    OsDetect.register_default(OS_OPENSUSE, OpenSuse())
-    OsDetect.register_default(OS_OPENSUSE13, OpenSuse(brand_file='/etc/SUSE-brand', release_file=None))
-    OsDetect.register_default(OS_OPENSUSE, FdoDetect("opensuse-tumbleweed"))
-    OsDetect.register_default(OS_OPENSUSE, FdoDetect("opensuse-leap"))
-    OsDetect.register_default(OS_OPENSUSE, FdoDetect("opensuse"))
-    OsDetect.register_default(OS_ORACLE, FdoDetect("ol"))
-    OsDetect.register_default(OS_TIZEN, FdoDetect("tizen"))
-    OsDetect.register_default(OS_SAILFISHOS, FdoDetect("sailfishos"))
-    OsDetect.register_default(OS_OSX, OSX())
-    OsDetect.register_default(OS_POP, LsbDetect("Pop"))
-    OsDetect.register_default(OS_QNX, QNX())
-    OsDetect.register_default(OS_RHEL, FdoDetect("rhel"))
-    OsDetect.register_default(OS_ROCKY, FdoDetect("rocky"))
-    OsDetect.register_default(OS_SLACKWARE, Slackware())
-    OsDetect.register_default(OS_UBUNTU, LsbDetect("Ubuntu"))
-    OsDetect.register_default(OS_CLEARLINUX, FdoDetect("clear-linux-os"))
-    OsDetect.register_default(OS_NIXOS, FdoDetect("nixos"))
-    OsDetect.register_default(OS_WINDOWS, Windows())
-    OsDetect.register_default(OS_ZORIN, LsbDetect("Zorin"))
+    OsDetect.register_default(OS_ALMALINUX, FdoDetect, "almalinux")
+    OsDetect.register_default(OS_ALPINE, FdoDetect, "alpine")
+    OsDetect.register_default(OS_AMAZON, FdoDetect, "amzn")
+    OsDetect.register_default(OS_ARCH, Arch)
+    OsDetect.register_default(OS_BUILDROOT, FdoDetect, "buildroot")
+    OsDetect.register_default(OS_MANJARO, Manjaro)
+    OsDetect.register_default(OS_CENTOS, FdoDetect, "centos")
+    OsDetect.register_default(OS_EULEROS, FdoDetect, "euleros")
+    OsDetect.register_default(OS_CYGWIN, Cygwin)
+    OsDetect.register_default(OS_DEBIAN, Debian)
+    OsDetect.register_default(OS_ELEMENTARY, LsbDetect, "elementary")
+    OsDetect.register_default(OS_ELEMENTARY_OLD, LsbDetect, "elementary OS")
+    OsDetect.register_default(OS_FEDORA, FdoDetect, "fedora")
+    OsDetect.register_default(OS_FREEBSD, FreeBSD)
+    OsDetect.register_default(OS_FUNTOO, Funtoo)
+    OsDetect.register_default(OS_GENTOO, Gentoo)
+    OsDetect.register_default(OS_LINARO, LsbDetect, "Linaro")
+    OsDetect.register_default(OS_MINT, LsbDetect, "LinuxMint")
+    OsDetect.register_default(OS_MX, LsbDetect, "MX")
+    OsDetect.register_default(OS_NEON, LsbDetect, "neon")
+    OsDetect.register_default(OS_OPENEMBEDDED, OpenEmbedded)
+    OsDetect.register_default(OS_OPENSUSE, OpenSuse)
+    OsDetect.register_default(OS_OPENSUSE13, OpenSuse, brand_file='/etc/SUSE-brand', release_file=None)
+    OsDetect.register_default(OS_OPENSUSE, FdoDetect, "opensuse-tumbleweed")
+    OsDetect.register_default(OS_OPENSUSE, FdoDetect, "opensuse-leap")
+    OsDetect.register_default(OS_OPENSUSE, FdoDetect, "opensuse")
+    OsDetect.register_default(OS_ORACLE, FdoDetect, "ol")
+    OsDetect.register_default(OS_TIZEN, FdoDetect, "tizen")
+    OsDetect.register_default(OS_SAILFISHOS, FdoDetect, "sailfishos")
+    OsDetect.register_default(OS_OSX, OSX)
+    OsDetect.register_default(OS_POP, LsbDetect, "Pop")
+    OsDetect.register_default(OS_QNX, QNX)
+    OsDetect.register_default(OS_RHEL, FdoDetect, "rhel")
+    OsDetect.register_default(OS_ROCKY, FdoDetect, "rocky")
+    OsDetect.register_default(OS_SLACKWARE, Slackware)
+    OsDetect.register_default(OS_UBUNTU, LsbDetect, "Ubuntu")
+    OsDetect.register_default(OS_CLEARLINUX, FdoDetect, "clear-linux-os")
+    OsDetect.register_default(OS_NIXOS, FdoDetect, "nixos")
+    OsDetect.register_default(OS_WINDOWS, Windows)
+    OsDetect.register_default(OS_ZORIN, LsbDetect, "Zorin")
 
 
     detect = OsDetect()
@@ -774,14 +1021,53 @@ def GetOsVersion():
 
 osversion = GetOsVersion()
 
+class TerminalRenderer():
+    """
+    终端输出
+    - 非TTY或者批处理模式下不做打字机效果,整段直接输出
+    - 交互终端下按帧输出打字机效果,帧率不超过fps,单次输出总时长不超过max_duration
+    """
+    def __init__(self,stream=None,fps=30,max_duration=0.3) -> None:
+        self.stream = stream
+        self.fps = fps
+        self.max_duration = max_duration
+        # 环境变量FISHROS_BATCH或者从配置文件自动选择时视为批处理模式
+        self.batch = os.environ.get("FISHROS_BATCH","0") not in ("","0")
+
+    def get_stream(self):
+        return self.stream or sys.stdout
+
+    def is_interactive(self):
+        stream = self.get_stream()
+        return not self.batch and hasattr(stream,"isatty") and stream.isatty()
+
+    def write(self,data,delay=0.03,end="\n",color="\033[37m"):
+        stream = self.get_stream()
+        data = str(data)
+        if delay<=0 or len(data)==0 or not self.is_interactive():
+            stream.write(color+data+end)
+            stream.flush()
+            return
+        duration = min(len(data)*delay,self.max_duration)
+        frames = max(1,int(duration*self.fps))
+        size = -(-len(data)//frames)
+        start = time.perf_counter()
+        stream.write(color)
+        for i in range(frames):
+            stream.write(data[i*size:(i+1)*size])
+            stream.flush()
+            wait = start+(i+1)*duration/frames-time.perf_counter()
+            if wait>0: time.sleep(wait)
+        stream.write(end)
+        stream.flush()
+
+renderer = TerminalRenderer()
+renderer.batch = renderer.batch or install_plan.active or config_helper.default_input_queue.qsize()>0
+
 class PrintUtils():
     @staticmethod
     def print_delay(data,delay=0.03,end="\n"):
-        for d in data:
-            d = d.encode("utf-8").decode("utf-8")
-            print("\033[37m{}".format(d),end="",flush=True)
-            time.sleep(delay)
-        print(end=end)
+        renderer.write(data,delay,end)
 
     @staticmethod
     def print_error(data,end="\n"):
@@ -825,6 +1111,7 @@ class Task():
     TASK_TYPE_CMD = 0
     TASK_TYPE_CHOOSE = 1
     TASK_TYPE_PATTERN= 2
+    TASK_TYPE_INPUT = 3
     def __init__(self,type) -> None:
         self.type = Task.TASK_TYPE_CMD
     def run(self):
@@ -832,103 +1119,565 @@ class Task():
 
 
 class Progress():
-    def __init__(self,timeout=10,scale=20) -> None:
+    """
+    命令运行进度
+    - update只记录最新一行和统计,由后台线程按fps刷新终端
+    - 显示旋转符号、耗时、行数/字节数和最新一行
+    - 非交互模式下不刷新,只在结束时输出一次结果
+    """
+    SPINNER = "/\\|-"
+
+    def __init__(self,timeout=10,scale=20,fps=10) -> None:
         self.timeout = timeout
         self.start = time.perf_counter()
         self.dur  = time.perf_counter() -self.start
         self.scale = scale
+        self.fps = fps
         self.i = 0
+        self.lines = 0
+        self.bytes = 0
+        self.log = ""
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.interactive = renderer.is_interactive()
 
     def update(self,log=""):
-        # length = 60
-        # if len(log)>length: log = log[:length]
-        # log = log+"                "
-        if (self.i%4) == 0:
-            print('\r[/]{}'.format(log),end="")
-        elif(self.i%4) == 1:
-            print('\r[\\]{}'.format(log),end="")
-        elif (self.i%4) == 2:
-            print('\r[|]{}'.format(log),end="")
-        elif (self.i%4) == 3:
-            print('\r[-]{}'.format(log),end="")
-        sys.stdout.flush()
+        with self.lock:
+            if log:
+                self.lines += 1
+                self.bytes += len(log.encode("utf-8"))
+                self.log = log
+        if self.thread is None and self.interactive:
+            self.thread = threading.Thread(target=self._render_loop,daemon=True)
+            self.thread.start()
+
+    @staticmethod
+    def _fit(text,width):
+        """
+        按终端显示宽度截断,中文等宽字符占两格
+        """
+        count = 0
+        for i,c in enumerate(text):
+            count += 2 if unicodedata.east_asian_width(c) in "WF" else 1
+            if count>width: return text[:i]
+        return text
+
+    @staticmethod
+    def _format_bytes(size):
+        for unit in ["B","KB","MB"]:
+            if size<1024: return "{:.0f}{}".format(size,unit)
+            size /= 1024.0
+        return "{:.1f}GB".format(size)
+
+    def _status(self):
+        self.dur = time.perf_counter()-self.start
+        return "{:.1f}s {}行/{}".format(self.dur,self.lines,Progress._format_bytes(self.bytes))
+
+    def _render(self):
+        with self.lock:
+            log = self.log.rstrip("\r").split("\r")[-1]
+            status = self._status()
+        width = shutil.get_terminal_size().columns-1
+        text = "[{}]{} {}".format(Progress.SPINNER[self.i%4],status,log)
+        renderer.get_stream().write("\r"+Progress._fit(text,width)+"\033[K")
+        renderer.get_stream().flush()
         self.i += 1
-        # update time
-        # self.dur  = time.perf_counter() -self.start
-        # self.i = int(self.dur/(self.timeout/self.scale))
-        # a = "🐟" * self.i
-        # b = ".." * (self.scale - self.i)
-        # c = (self.i / self.scale) * 100
-        #
-        # log += " "*()
-        # print("\r{:^3.0f}%[{}->{}]{:.2f}s {}".format(c,a,b,self.dur,log),end = "")
+
+    def _render_loop(self):
+        self._render()
+        while not self.stop_event.wait(1.0/self.fps):
+            self._render()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
 
     def finsh(self,log=""):
-        length = 60
-        if len(log)>length: log = log[:length]
-        log = log+"                           "
-        print('\r[-]{}'.format(log),end="")
-        # i = self.scale
-        # a = "🐟" * i
-        # b = ".." * (self.scale - i)
-        # c = (i / self.scale) * 100
-        # print("\r{:^3.0f}%[{}->{}]{:.2f}s {}".format(c,a,b,self.dur,log),end = "")
+        self.stop()
+        log = "{} {}".format(log,self._status())
+        if self.interactive:
+            print('\r[-]{}\033[K'.format(Progress._fit(log,shutil.get_terminal_size().columns-4)),end="")
+        else:
+            print('[-]{}'.format(log),end="")
+
+
+
+class CmdOutput():
+    """
+    命令输出缓存,用法和列表一致(遍历/下标/len/比较)
+    - 内存中最多保留最近的max_lines行
+    - 超出后把完整输出流式写入gzip日志文件,遍历和搜索时从日志里惰性读取
+    - 日志文件只在本进程内使用,进程退出时删除
+    """
+    log_dir = "/tmp/fishros_log/"
+    max_lines = 2000
+    _count = 0
+    _log_files = []
+
+    def __init__(self,name="out",max_lines=None) -> None:
+        self.name = name
+        self.lines = deque(maxlen=max_lines or CmdOutput.max_lines)
+        self.total = 0
+        self.log_file = None
+        self._writer = None
+
+    def _spill(self):
+        CmdOutput._count += 1
+        os.makedirs(CmdOutput.log_dir,exist_ok=True)
+        self.log_file = os.path.join(CmdOutput.log_dir,"{}-{}-{}-{}.log.gz".format(
+            time.strftime("%Y%m%d%H%M%S"),os.getpid(),CmdOutput._count,self.name))
+        CmdOutput._log_files.append(self.log_file)
+        self._writer = gzip.open(self.log_file,"wt",encoding="utf-8",newline="\n",compresslevel=3)
+        for line in self.lines:
+            self._write(line)
+
+    def _write(self,line):
+        # out中的行去掉了换行符,err中的行保留换行符,这里统一按一行一条写入
+        if line.endswith("\n"): self._writer.write(line)
+        else: self._writer.write(line+"\n")
+
+    def append(self,line):
+        if self._writer is None and self.log_file is None and len(self.lines)==self.lines.maxlen:
+            self._spill()
+        if self._writer is not None: self._write(line)
+        self.lines.append(line)
+        self.total += 1
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    @staticmethod
+    def cleanup():
+        """
+        删除本进程写入的日志文件
+        """
+        for path in CmdOutput._log_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        CmdOutput._log_files.clear()
+        try:
+            os.rmdir(CmdOutput.log_dir)
+        except OSError:
+            pass
+
+    @property
+    def spilled(self):
+        return self.log_file is not None
+
+    def __iter__(self):
+        if not self.spilled:
+            return iter(list(self.lines))
+        return self._iter_log()
+
+    def _iter_log(self):
+        if self._writer is not None: self._writer.flush()
+        # 只有err中的行保留换行符,按内存中的行判断格式
+        keepends = len(self.lines)>0 and self.lines[0].endswith("\n")
+        count = 0
+        try:
+            with gzip.open(self.log_file,"rt",encoding="utf-8",newline="\n") as f:
+                for line in f:
+                    count += 1
+                    # 最后一行若原本没有换行符则不补
+                    if count==self.total and not self.lines[-1].endswith("\n"): line = line[:-1]
+                    elif not keepends: line = line[:-1]
+                    yield line
+                    if count==self.total: return
+        except EOFError:
+            # 还在写入中的日志没有结束标记
+            pass
+
+    def __len__(self):
+        return self.total
+
+    def __bool__(self):
+        return self.total>0
+
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            start,stop,step = index.indices(self.total)
+            # islice不支持负的步长,与list一致需要先取出全部行
+            if step<0: return list(self)[index]
+            return list(itertools.islice(iter(self),start,stop,step))
+        if index<0: index += self.total
+        if index<0 or index>=self.total: raise IndexError("CmdOutput index out of range")
+        offset = index-(self.total-len(self.lines))
+        if offset>=0: return self.lines[offset]
+        return next(itertools.islice(iter(self),index,None))
+
+    def __eq__(self,other):
+        if isinstance(other,(list,tuple,CmdOutput)):
+            return list(self)==list(other)
+        return NotImplemented
+
+    def __add__(self,other):
+        return list(self)+list(other)
+
+    def __radd__(self,other):
+        return list(other)+list(self)
+
+    def search(self,pattern):
+        """
+        在完整输出中查找,返回第一个匹配结果
+        """
+        if isinstance(pattern,str): pattern = re.compile(pattern)
+        for line in self:
+            match = pattern.search(line)
+            if match: return match
+        return None
+
+    def tail(self,count=10):
+        return list(self.lines)[-count:]
+
+    def __repr__(self):
+        if not self.spilled: return repr(list(self.lines))
+        return "[...共{}行,完整日志:{}...] {}".format(self.total,self.log_file,repr(self.tail()))
+
+    __str__ = __repr__
+
+atexit.register(CmdOutput.cleanup)
+
+
+class OutputMatcher():
+    """
+    把多组关键字(正则)合并成一个正则,在命令输出流中逐行匹配,命中时立即记录事件
+    - events: {事件名:[正则,...]}
+    - abort_on: 命中这些事件时提前结束命令
+    - callback: 命中事件时回调callback(event,line)
+    """
+    APT_EVENTS = {
+        'unmet_dependency':['未满足的依赖关系','[Uu]nmet dependencies','but it is not installable'],
+        'certificate_error':['[Cc]ertificate verification failed','证书验证失败'],
+        'fix_broken':['apt --fix-broken install'],
+        'no_pubkey':['NO_PUBKEY'],
+        'dpkg_lock':['Could not get lock','无法获得锁'],
+    }
+
+    def __init__(self,events,abort_on=None,callback=None) -> None:
+        self.names = {}
+        parts = []
+        for i,(event,patterns) in enumerate(events.items()):
+            group = "e{}".format(i)
+            self.names[group] = event
+            parts.append("(?P<{}>{})".format(group,"|".join("(?:{})".format(p) for p in patterns)))
+        self.pattern = re.compile("|".join(parts))
+        self.abort_on = set(abort_on or [])
+        self.callback = callback
+        self.hits = {}
+        self.abort = False
+
+    @staticmethod
+    def apt(abort_on=None,callback=None):
+        """
+        apt常见错误的匹配器
+        """
+        return OutputMatcher(OutputMatcher.APT_EVENTS,abort_on=abort_on,callback=callback)
+
+    def feed(self,line):
+        """
+        匹配一行输出,返回本行新命中的事件
+        """
+        new_events = []
+        for match in self.pattern.finditer(line):
+            event = self.names[match.lastgroup]
+            if event in self.hits: continue
+            self.hits[event] = line
+            new_events.append(event)
+            if event in self.abort_on: self.abort = True
+            if self.callback: self.callback(event,line)
+        return new_events
+
+    def has(self,event):
+        return event in self.hits
+
+
+class LineDecoder():
+    """
+    把按块读到的字节流解码并切分成行,行尾保留换行符(与readline一致)
+    """
+    def __init__(self) -> None:
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.pending = ""
+
+    def feed(self,data):
+        """
+        data为空表示输出结束,返回剩余不完整的行
+        """
+        text = self.pending+self.decoder.decode(data,final=not data)
+        lines = text.split("\n")
+        self.pending = lines.pop()
+        lines = [line+"\n" for line in lines]
+        if not data and self.pending:
+            lines.append(self.pending)
+            self.pending = ""
+        return lines
+
 
+class CmdOutputPump():
+    """
+    基于selectors同时读取子进程的stdout和stderr
+    - 按块读取,不会因为某一路管道写满而把子进程卡死
+    - 切分成行后回调
+    - 没有固定的sleep,有数据就处理
+    """
+    def __init__(self,chunk_size=4096) -> None:
+        self.chunk_size = chunk_size
+        self.selector = selectors.DefaultSelector()
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+    def register(self,fileobj,callback):
+        self.selector.register(fileobj,selectors.EVENT_READ,(callback,LineDecoder()))
+
+    def pump(self,timeout=None):
+        """
+        读取一轮数据,返回是否还有未关闭的输出
+        """
+        if not self.selector.get_map(): return False
+        for key,_ in self.selector.select(timeout):
+            callback,decoder = key.data
+            data = os.read(key.fd,self.chunk_size)
+            for line in decoder.feed(data):
+                callback(line)
+            if not data: self.selector.unregister(key.fileobj)
+        return len(self.selector.get_map())>0
+
+    def run(self,deadline=None):
+        """
+        一直读到所有输出关闭返回True,超过deadline(time.time()时间点)还未读完返回False
+        """
+        try:
+            while not self.stopped:
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline-time.time()
+                    if timeout<=0: return False
+                if not self.pump(timeout): return True
+            return True
+        finally:
+            self.selector.close()
 
 
 class CmdTask(Task):
-    def __init__(self,command,timeout=0,groups=False,os_command=False,path=None,executable='/bin/sh') -> None:
+    """
+    - timeout: 超时时间(秒),0表示不限制,超时后结束整个进程组
+      apt/dpkg的安装卸载不受timeout限制: dpkg运行中被结束会让系统处于需要dpkg --configure -a的状态
+    - retry: 超时后的重试次数
+    - retry_delay: 重试前的等待时间(秒),每次重试翻倍
+    - matcher: OutputMatcher,运行过程中逐行匹配输出,命中abort_on事件时提前结束命令
+    - tee: 在伪终端中运行,输出原样实时显示并且可以交互(如aptitude的选择),同时记录输出用于判断结果,
+      stdout和stderr合并到out中
+    """
+    TIMEOUT_MSG = '运行超时:请切换网络后重试'
+    ANSI_ESCAPE = re.compile(r"\x1b(\[[0-9;?]*[ -/]*[@-~]|[()][0-9A-Za-z]|[=>])")
+
+    def __init__(self,command,timeout=0,groups=False,os_command=False,path=None,executable='/bin/sh',retry=0,retry_delay=1,matcher=None,tee=False) -> None:
         super().__init__(Task.TASK_TYPE_CMD)
         self.command = command
         self.timeout = timeout
+        if timeout and AptScheduler.is_dpkg_command(command): self.timeout = 0
         self.os_command = os_command
         self.cwd = path
         self.executable = executable
+        self.retry = retry
+        self.retry_delay = retry_delay
+        self.matcher = matcher
+        self.tee = tee
+
+    @staticmethod
+    def kill_group(sub,grace=3):
+        """
+        结束整个进程组(shell以及shell拉起的所有子进程)
+        """
+        try:
+            os.killpg(sub.pid,signal.SIGTERM)
+            sub.wait(timeout=grace)
+        except (OSError,subprocess.TimeoutExpired):
+            pass
+        try:
+            os.killpg(sub.pid,signal.SIGKILL)
+        except OSError:
+            pass
+        sub.wait()
 
     @staticmethod
-    def __run_command(command,timeout=10,cwd=None,executable='/bin/sh'):
-        out,err = [],[]
+    def __run_command(command,timeout=10,cwd=None,executable='/bin/sh',matcher=None):
+        out,err = CmdOutput("out"),CmdOutput("err")
+        # 单独的进程组,超时可以把管道里的命令一起结束
         sub = subprocess.Popen(command,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             cwd=cwd,
             shell=True,
-            executable=executable)
+            executable=executable,
+            start_new_session=True)
 
-        # sub.communicate
         bar  = Progress(timeout=timeout)
         bar.update()
+        pump = CmdOutputPump()
 
-        while sub.poll()==None:
-            line = sub.stdout.readline()
-            line = line.decode("utf-8").strip("\n")
-            out.append(line)
-            bar.update(line)
-            time.sleep(0.01)
+        def on_line(line):
+            if matcher is None: return
+            matcher.feed(line)
+            if matcher.abort: pump.stop()
 
-        lines = sub.stdout.readlines()
-        for line in lines:
-            line = line.decode("utf-8").strip("\n")
+        def on_stdout(line):
+            line = line.strip("\n")
             out.append(line)
             bar.update(line)
-            time.sleep(0.01)
+            on_line(line)
 
+        def on_stderr(line):
+            err.append(line)
+            bar.update(line.strip("\n"))
+            on_line(line)
 
-        if sub.poll()==None:
-            sub.kill()
-            print("\033[31mTimeOut!:{}".format(timeout))
-            return None,'','运行超时:请切换网络后重试'
+        deadline = None
+        if timeout and timeout>0: deadline = time.time()+timeout
+
+        pump.register(sub.stdout,on_stdout)
+        pump.register(sub.stderr,on_stderr)
+        try:
+            finished = pump.run(deadline)
+            if pump.stopped:
+                PrintUtils.print_warn("\n检测到{},提前结束命令".format(",".join(e for e in matcher.hits if e in matcher.abort_on)))
+                CmdTask.kill_group(sub)
+            elif finished:
+                try:
+                    sub.wait(timeout=None if deadline is None else max(deadline-time.time(),0))
+                except subprocess.TimeoutExpired:
+                    finished = False
+            # 超时信息要在关闭输出之前写入,否则溢出到日志的输出读不到这一行
+            if not finished: err.append(CmdTask.TIMEOUT_MSG+"\n")
+        except BaseException:
+            # Ctrl-C或者读取输出时出错(写日志失败、matcher回调异常等),都要停止进度条并结束整个进程组
+            bar.stop()
+            CmdTask.kill_group(sub)
+            raise
+        finally:
+            out.close()
+            err.close()
+
+        if not finished:
+            CmdTask.kill_group(sub)
+            bar.finsh('Result:timeout')
+            print("\n\033[31mTimeOut!:{}".format(timeout))
+            return (None,out,err)
 
         code = sub.returncode
         msg = 'code:{}'.format(code)
         if code == 0: msg="success"
         bar.finsh('Result:{}'.format(msg))
 
-        for line in  sub.stderr.readlines():
-            err.append(line.decode('utf-8'))
         print("\n")
         return (code,out,err)
 
+    @staticmethod
+    def _set_ctty():
+        # 子进程中运行:把伪终端设置为控制终端
+        try:
+            fcntl.ioctl(0,termios.TIOCSCTTY,0)
+        except OSError:
+            pass
+
+    @staticmethod
+    def __run_tee(command,timeout=0,cwd=None,executable='/bin/sh',matcher=None):
+        out,err = CmdOutput("out"),CmdOutput("err")
+        master,slave = pty.openpty()
+        sys.stdout.flush()
+        try:
+            stdin_fd = sys.stdin.fileno()
+            interactive = os.isatty(stdin_fd)
+        except (AttributeError,ValueError,OSError):
+            stdin_fd,interactive = None,False
+        try:
+            stdout_fd = sys.stdout.fileno()
+        except (AttributeError,ValueError,OSError):
+            stdout_fd = 1
+        if os.isatty(stdout_fd):
+            try:
+                fcntl.ioctl(slave,termios.TIOCSWINSZ,fcntl.ioctl(stdout_fd,termios.TIOCGWINSZ,b"\0"*8))
+            except OSError:
+                pass
+        sub = subprocess.Popen(command,stdin=slave,stdout=slave,stderr=slave,cwd=cwd,shell=True,
+            executable=executable,start_new_session=True,preexec_fn=CmdTask._set_ctty)
+        os.close(slave)
+
+        old_attr = None
+        if interactive:
+            old_attr = termios.tcgetattr(stdin_fd)
+            tty.setraw(stdin_fd)
+        sel = selectors.DefaultSelector()
+        sel.register(master,selectors.EVENT_READ)
+        if interactive: sel.register(stdin_fd,selectors.EVENT_READ)
+        decoder = LineDecoder()
+        deadline = None
+        if timeout and timeout>0: deadline = time.time()+timeout
+
+        def on_line(line):
+            # 进度条用\r刷新,只保留最后一段
+            line = CmdTask.ANSI_ESCAPE.sub("",line.rstrip("\r\n")).split("\r")[-1]
+            out.append(line)
+            if matcher is None: return False
+            matcher.feed(line)
+            return matcher.abort
+
+        finished,aborted = False,False
+        try:
+            while not finished and not aborted:
+                wait = None
+                if deadline is not None:
+                    wait = deadline-time.time()
+                    if wait<=0: break
+                for key,_ in sel.select(wait):
+                    if key.fd==master:
+                        try:
+                            data = os.read(master,4096)
+                        except OSError:
+                            # 子进程关闭伪终端后读取会返回EIO
+                            data = b""
+                        if data: os.write(stdout_fd,data)
+                        for line in decoder.feed(data):
+                            if on_line(line): aborted = True
+                        if not data: finished = True
+                    else:
+                        data = os.read(stdin_fd,1024)
+                        if data: os.write(master,data)
+                        else: sel.unregister(stdin_fd)
+            if finished:
+                try:
+                    sub.wait(timeout=None if deadline is None else max(deadline-time.time(),0))
+                except subprocess.TimeoutExpired:
+                    finished = False
+            if not finished and not aborted: err.append(CmdTask.TIMEOUT_MSG+"\n")
+        except BaseException:
+            CmdTask.kill_group(sub)
+            raise
+        finally:
+            if old_attr is not None: termios.tcsetattr(stdin_fd,termios.TCSADRAIN,old_attr)
+            sel.close()
+            os.close(master)
+            out.close()
+            err.close()
+
+        if aborted:
+            PrintUtils.print_warn("\n检测到{},提前结束命令".format(",".join(e for e in matcher.hits if e in matcher.abort_on)))
+            CmdTask.kill_group(sub)
+        elif not finished:
+            CmdTask.kill_group(sub)
+            print("\n\033[31mTimeOut!:{}".format(timeout))
+            return (None,out,err)
+        return (sub.returncode,out,err)
+
     @staticmethod
     def _os_command(command,timeout=10,cwd=None):
         if cwd is not None:
@@ -938,21 +1687,148 @@ class CmdTask(Task):
 
     def run(self):
         PrintUtils.print_info("\033[32mRun CMD Task:[{}]".format(self.command))
+        # apt/dpkg写操作排队运行,等待其他进程释放dpkg锁
+        with apt_scheduler.hold(self.command):
+            return self._run()
+
+    def _run(self):
         if self.os_command:
             return self._os_command(self.command,self.timeout,cwd=self.cwd)
-        return self.__run_command(self.command,self.timeout,cwd=self.cwd,executable=self.executable)
+        run_command = self.__run_tee if self.tee else self.__run_command
+        result = run_command(self.command,self.timeout,cwd=self.cwd,executable=self.executable,matcher=self.matcher)
+        for i in range(self.retry):
+            if result[0] is not None: break
+            delay = self.retry_delay*(2**i)
+            PrintUtils.print_warn("运行超时,{}秒后第{}次重试:[{}]".format(delay,i+1,self.command))
+            time.sleep(delay)
+            result = run_command(self.command,self.timeout,cwd=self.cwd,executable=self.executable,matcher=self.matcher)
+        return result
+
 
 
+class CmdTaskExecutor():
+    """
+    基于asyncio并发运行互不依赖的CmdTask,所有输出合并到同一个进度条
+    executor = CmdTaskExecutor(max_workers=3)
+    executor.submit(CmdTask("..."))
+    results = executor.run() # 与提交顺序一致的(code,out,err)列表
+    asyncio只在这里用到,导入较慢,在用到时才导入
+    """
+    def __init__(self,max_workers=4,chunk_size=4096) -> None:
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.tasks = []
+
+    def submit(self,task):
+        self.tasks.append(task)
+        return len(self.tasks)-1
+
+    async def _read_stream(self,stream,callback):
+        decoder = LineDecoder()
+        while True:
+            data = await stream.read(self.chunk_size)
+            for line in decoder.feed(data):
+                callback(line)
+            if not data: break
+
+    async def _run_once(self,task,on_stdout,on_stderr):
+        import asyncio
+        sub = await asyncio.create_subprocess_shell(task.command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=task.cwd,
+            executable=task.executable,
+            start_new_session=True)
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                self._read_stream(sub.stdout,on_stdout),
+                self._read_stream(sub.stderr,on_stderr),
+                sub.wait()),task.timeout if task.timeout and task.timeout>0 else None)
+        except asyncio.TimeoutError:
+            try:
+                os.killpg(sub.pid,signal.SIGKILL)
+            except OSError:
+                pass
+            await sub.wait()
+            return None
+        return sub.returncode
+
+    async def _run_task(self,index,task,semaphore,bar):
+        import asyncio
+        out,err = CmdOutput("out"),CmdOutput("err")
+        tag = "[{}/{}]".format(index+1,len(self.tasks))
+
+        def on_stdout(line):
+            line = line.strip("\n")
+            out.append(line)
+            bar.update(tag+line)
+            if task.matcher: task.matcher.feed(line)
+
+        def on_stderr(line):
+            err.append(line)
+            bar.update(tag+line.strip("\n"))
+            if task.matcher: task.matcher.feed(line)
+
+        async with semaphore:
+            # apt/dpkg写操作在线程池中排队,不阻塞事件循环
+            hold = AptScheduler.is_write_command(task.command)
+            if hold: await asyncio.get_event_loop().run_in_executor(None,apt_scheduler.acquire)
+            try:
+                code = await self._run_once(task,on_stdout,on_stderr)
+                for i in range(task.retry):
+                    if code is not None: break
+                    await asyncio.sleep(task.retry_delay*(2**i))
+                    code = await self._run_once(task,on_stdout,on_stderr)
+            finally:
+                if hold: apt_scheduler.release()
+        if code is None: err.append(CmdTask.TIMEOUT_MSG+"\n")
+        out.close()
+        err.close()
+        return (code,out,err)
+
+    async def run_async(self):
+        import asyncio
+        semaphore = asyncio.Semaphore(self.max_workers)
+        bar = Progress()
+        bar.update()
+        results = await asyncio.gather(*[self._run_task(i,task,semaphore,bar) for i,task in enumerate(self.tasks)])
+        failed = len([result for result in results if result[0]!=0])
+        bar.finsh('Result:{}/{} success'.format(len(results)-failed,len(results)))
+        print("\n")
+        return list(results)
+
+    def run(self):
+        import asyncio
+        for i,task in enumerate(self.tasks):
+            PrintUtils.print_info("\033[32mRun CMD Task[{}/{}]:[{}]".format(i+1,len(self.tasks),task.command))
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            results = loop.run_until_complete(self.run_async())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        for i,result in enumerate(results):
+            if result[0]==0: PrintUtils.print_success("[{}/{}]success:{}".format(i+1,len(results),self.tasks[i].command))
+            else: PrintUtils.print_error("[{}/{}]code:{}:{}".format(i+1,len(results),result[0],self.tasks[i].command))
+        return results
+
 
 class ChooseTask(Task):
-    def __init__(self,dic,tips,array=False) -> None:
+    """
+    - key: 提示的稳定名称(如ros.version),安装计划按key回答
+    - names: {选项编号:选项名},安装计划中可以用选项名回答
+    """
+    def __init__(self,dic,tips,array=False,key=None,names=None) -> None:
         self.tips= tips
         self.dic = dic
         self.array = array
+        self.key = key
+        self.names = names
         super().__init__(Task.TASK_TYPE_CHOOSE)
 
     @staticmethod
-    def __choose(data,tips,array):
+    def __choose(data,tips,array,key=None,names=None):
         if array:
             count = 1
             dic = {}
@@ -964,8 +1840,13 @@ class ChooseTask(Task):
         dic[0]="quit"
         # 0 quit
         choose = -1
-        for key in dic:
-            PrintUtils.print_delay('[{}]:{}'.format(key,dic[key]),0.005)
+        PrintUtils.print_delay("\n".join('[{}]:{}'.format(item,dic[item]) for item in dic),0.005)
+
+        if install_plan.active:
+            choose = install_plan.answer(key,dic,names,tips)
+            PrintUtils.print_info("安装计划选择：[{}]:{}".format(choose,dic[choose]))
+            config_helper.record_choose({"choose":choose,"desc":dic[choose],"key":key})
+            return choose,dic[choose]
 
         choose = None
         choose_item = config_helper.get_input_value()
@@ -982,14 +1863,16 @@ class ChooseTask(Task):
                 if (int(choose) in dic.keys() ) or (int(choose)==0):
                     choose = int(choose)
                     break
-        config_helper.record_choose({"choose":choose,"desc":dic[choose]})
+            # 配置文件中的选项无效时改为手动输入
+            choose_item = None
+        config_helper.record_choose({"choose":choose,"desc":dic[choose],"key":key})
         PrintUtils.print_fish()
         return choose,dic[choose]
 
     def run(self):
         PrintUtils.print_delay("RUN Choose Task:[请输入括号内的数字]")
         PrintUtils.print_delay(self.tips,0.001)
-        return ChooseTask.__choose(self.dic,self.tips,self.array)
+        return ChooseTask.__choose(self.dic,self.tips,self.array,self.key,self.names)
 
 
 class ChooseWithCategoriesTask(Task):
@@ -1008,14 +1891,16 @@ class ChooseWithCategoriesTask(Task):
         choose_id = -1
 
         tool_ids = [0]
-        # 打印不同类型工具的分类结果
+        # 打印不同类型工具的分类结果,整个菜单一次输出
+        menu = []
         for tool_type, tools_list in dic.items():
-            PrintUtils.print_delay("{}:".format(categories[tool_type]),0.005)
+            menu.append("{}:".format(categories[tool_type]))
             for tool_id,tool_info in tools_list.items():
-                PrintUtils.print_delay("  [{}]:{}".format(tool_id,tool_info['tip']),0.005)
+                menu.append("  [{}]:{}".format(tool_id,tool_info['tip']))
                 tool_ids.append(tool_id)
-            print()
-        PrintUtils.print_delay("[0]:quit\n",0.005)
+            menu.append("")
+        menu.append("[0]:quit\n")
+        PrintUtils.print_delay("\n".join(menu),0.005)
 
         choose = None
         choose_item = config_helper.get_input_value()
@@ -1032,6 +1917,7 @@ class ChooseWithCategoriesTask(Task):
                 if int(choose_id) in tool_ids :
                     choose_id = int(choose_id)
                     break
+            choose_item = None
         config_helper.record_choose({"choose":choose_id,"desc":""})
         PrintUtils.print_fish()
         return choose_id,""
@@ -1042,11 +1928,380 @@ class ChooseWithCategoriesTask(Task):
         return ChooseWithCategoriesTask.__choose(self.dic,self.tips,self.array,self.categories)
 
 
+class InputTask(Task):
+    """
+    读取一行输入,执行安装计划时从answers[key]中获取
+    - default: 安装计划没有回答时使用的值,为None时直接失败
+    - validate: 检查输入是否有效,无效时重新输入;执行安装计划时不会重新询问,直接失败
+    """
+    def __init__(self,tips,key=None,default=None,validate=None) -> None:
+        self.tips = tips
+        self.key = key
+        self.default = default
+        self.validate = validate
+        super().__init__(Task.TASK_TYPE_INPUT)
+
+    def run(self):
+        if install_plan.active:
+            value = install_plan.ask(self.key,self.tips,self.default)
+            if self.validate and not self.validate(value):
+                raise PlanError("安装计划中{}={}无效:{}".format(self.key,repr(value),self.tips))
+            PrintUtils.print_info("{}{}".format(self.tips,value))
+            return value
+        while True:
+            value = input(self.tips)
+            if self.validate is None or self.validate(value): return value
+
+
+class SystemFacts():
+    """
+    系统信息,按需计算并在进程内缓存,避免每次都启动子进程
+    - arch/codename/users/homes/bashrc/cpu_count/mem_total
+    - 指定cache_file时,persist_keys中的信息会写入磁盘,同一次开机内ttl秒内复用
+    """
+    persist_keys = ("arch","cpu_count","mem_total")
+    # platform.machine() -> dpkg架构名,元组第二项为32位用户空间时的架构
+    machine_arch = {
+        "x86_64":("amd64","i386"), "amd64":("amd64","i386"),
+        "i386":("i386","i386"), "i486":("i386","i386"), "i586":("i386","i386"), "i686":("i386","i386"),
+        "aarch64":("arm64","armhf"), "arm64":("arm64","armhf"),
+        "armv7l":("armhf","armhf"), "armv8l":("armhf","armhf"), "armv6l":("armhf","armhf"),
+        "ppc64le":("ppc64el","powerpc"), "s390x":("s390x","s390x"), "riscv64":("riscv64","riscv64"),
+    }
+
+    def __init__(self,cache_file=None,ttl=24*3600) -> None:
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self._facts = None
+
+    def _boot_id(self):
+        try:
+            with open("/proc/sys/kernel/random/boot_id") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _load(self):
+        self._facts = {}
+        if not self.cache_file: return
+        try:
+            with open(self.cache_file) as f:
+                data = json.load(f)
+        except (OSError,ValueError):
+            return
+        if data.get("boot_id")!=self._boot_id() or time.time()-data.get("time",0)>self.ttl:
+            return
+        for key in self.persist_keys:
+            if data.get(key) is not None: self._facts[key] = data[key]
+
+    def _save(self):
+        if not self.cache_file: return
+        data = {"boot_id":self._boot_id(),"time":time.time()}
+        for key in self.persist_keys:
+            data[key] = self._facts.get(key)
+        try:
+            os.makedirs(os.path.dirname(self.cache_file),exist_ok=True)
+            tmp = "{}.{}".format(self.cache_file,os.getpid())
+            with open(tmp,"w") as f:
+                json.dump(data,f)
+            os.replace(tmp,self.cache_file)
+        except OSError:
+            pass
+
+    def get(self,key,compute):
+        if self._facts is None: self._load()
+        if key not in self._facts:
+            self._facts[key] = compute()
+            if key in self.persist_keys and self._facts[key] is not None: self._save()
+        return self._facts[key]
+
+    def clear(self):
+        self._facts = {}
+
+    @property
+    def arch(self):
+        """dpkg风格的系统架构,如amd64/arm64/armhf,获取失败返回None"""
+        return self.get("arch",self._get_arch)
+
+    def _get_arch(self):
+        machine = platform.machine().lower()
+        if machine in self.machine_arch:
+            arch64,arch32 = self.machine_arch[machine]
+            # 64位内核上运行32位用户空间(如树莓派armhf系统)
+            if platform.architecture()[0]=="32bit": return arch32
+            return arch64
+        result = CmdTask("dpkg --print-architecture",2).run()
+        if result[0]==0 and len(result[1])>0: return result[1][0].strip()
+        return None
+
+    @property
+    def codename(self):
+        return self.get("codename",osversion.get_codename)
+
+    @property
+    def users(self):
+        """
+        用户名列表,与原来users命令的语义一致:只包含sudo的发起用户和当前登录的用户,
+        第一个为sudo的发起用户,没有时为登录用户,都没有时为当前用户(可能是root)
+        调用方用[0]写入单个用户的配置,不会写到系统中其他没有登录的用户
+        """
+        return self.get("users",self._get_users)
+
+    def _get_users(self):
+        users = []
+        sudo_user = os.environ.get("SUDO_USER")
+        if sudo_user and sudo_user!="root": users.append(sudo_user)
+        try:
+            logged = subprocess.run(["users"],stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,timeout=5).stdout.decode("utf-8","ignore").split()
+        except (OSError,subprocess.SubprocessError):
+            logged = []
+        for user in logged:
+            if user not in users: users.append(user)
+        if len(users)==0: users.append(getpass.getuser())
+        return users
+
+    @property
+    def homes(self):
+        """与users对应的home目录,以/结尾"""
+        return self.get("homes",lambda: [self.home_of(user) for user in self.users])
+
+    @staticmethod
+    def home_of(user):
+        try:
+            home = pwd.getpwnam(user).pw_dir
+        except KeyError:
+            home = "/root" if user=="root" else "/home/"+str(user)
+        return home.rstrip("/")+"/"
+
+    @property
+    def bashrc(self):
+        """
+        优先home,没有home提供root
+        """
+        def find():
+            files = sorted(glob.glob("/home/*/.bashrc"))
+            if len(files)==0 and os.path.exists("/root/.bashrc"): files = ["/root/.bashrc"]
+            return files
+        return self.get("bashrc",find)
+
+    @property
+    def cpu_count(self):
+        return self.get("cpu_count",lambda: os.cpu_count() or 1)
+
+    @property
+    def mem_total(self):
+        """总内存,字节"""
+        def read():
+            try:
+                with open("/proc/meminfo") as f:
+                    for line in f:
+                        if line.startswith("MemTotal:"): return int(line.split()[1])*1024
+            except (OSError,ValueError):
+                pass
+            return None
+        return self.get("mem_total",read)
+
+system_facts = SystemFacts(cache_file=os.path.join(cache_dir,"systemfacts.json"))
+
+
+class Downloader():
+    """
+    分段并发下载
+    - 服务器支持Range时分成segments段并发下载,不支持时单线程下载
+    - 下载中的数据写在path.part,进度记录在path.part.json,断线或者中断后再次下载从已完成的位置继续
+    - 每段失败后按retry_delay*2**i等待重试retry次
+    - 分段下载时每段按Content-Range的总大小下载完整,单线程下载时检查文件大小与Content-Length一致
+    - 指定sha256或者sha256_url(SHASUMS256.txt格式的校验文件)时校验,不一致删除文件并返回False
+    """
+    chunk_size = 64*1024
+
+    def __init__(self,segments=4,timeout=15,retry=3,retry_delay=1) -> None:
+        self.segments = segments
+        self.timeout = timeout
+        self.retry = retry
+        self.retry_delay = retry_delay
+
+    def _open(self,url,start=None,end=None):
+        headers = {"User-Agent":"fishros-install"}
+        if start is not None: headers["Range"] = "bytes={}-{}".format(start,"" if end is None else end)
+        return urllib.request.urlopen(urllib.request.Request(url,headers=headers),timeout=self.timeout)
+
+    def _probe(self,url):
+        """
+        返回(文件大小,是否支持Range,ETag/Last-Modified),大小未知时为None
+        """
+        with self._open(url,0,0) as response:
+            validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+            content_range = response.headers.get("Content-Range","")
+            if response.status==206 and "/" in content_range and not content_range.endswith("/*"):
+                return int(content_range.rsplit("/",1)[1]),True,validator
+            length = response.headers.get("Content-Length")
+            return (int(length) if length else None),False,validator
+
+    def _load_state(self,state_file,url,size,validator):
+        try:
+            with open(state_file) as f:
+                state = json.load(f)
+        except (OSError,ValueError):
+            return None
+        if state.get("url")!=url or state.get("size")!=size or state.get("validator")!=validator: return None
+        return state
+
+    def _save_state(self,state_file,state,lock):
+        with lock:
+            data = json.dumps(state)
+        tmp = state_file+".tmp"
+        with open(tmp,"w") as f:
+            f.write(data)
+        os.replace(tmp,state_file)
+
+    def _fetch_segment(self,url,fd,segment,lock,stop):
+        """
+        segment: [start,end,done],下载[start+done,end]
+        """
+        for i in range(self.retry+1):
+            try:
+                start,end,done = segment
+                if start+done>end: return True
+                with self._open(url,start+done,end) as response:
+                    if response.status!=206: raise OSError("server ignored range")
+                    while not stop.is_set():
+                        data = response.read(min(Downloader.chunk_size,end-start-segment[2]+1))
+                        if not data: break
+                        os.pwrite(fd,data,start+segment[2])
+                        with lock:
+                            segment[2] += len(data)
+                if stop.is_set(): return False
+                if segment[0]+segment[2]>segment[1]: return True
+            except (OSError,http.client.HTTPException):
+                pass
+            if i<self.retry and not stop.is_set(): time.sleep(self.retry_delay*(2**i))
+        return False
+
+    def _fetch_single(self,url,part):
+        with self._open(url) as response, open(part,"wb") as f:
+            shutil.copyfileobj(response,f,Downloader.chunk_size)
+
+    def checksum(self,sums_url,name):
+        """
+        从SHASUMS256.txt格式(每行"<sha256>  <文件名>")的校验文件中取出name的sha256,取不到时返回None
+        """
+        try:
+            with self._open(sums_url) as response:
+                lines = response.read().decode("utf-8","replace").splitlines()
+        except (OSError,http.client.HTTPException) as e:
+            PrintUtils.print_warn("获取校验文件失败:{}".format(e))
+            return None
+        for line in lines:
+            fields = line.split()
+            if len(fields)==2 and fields[1].lstrip("*")==name: return fields[0].lower()
+        return None
+
+    @staticmethod
+    def _discard(*paths):
+        for name in paths:
+            if os.path.exists(name): os.remove(name)
+
+    @staticmethod
+    def sha256sum(path):
+        sha256 = hashlib.sha256()
+        with open(path,"rb") as f:
+            for chunk in iter(lambda: f.read(1024*1024),b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def _report(self,done,size,start):
+        speed = done/max(time.time()-start,1e-6)
+        total = Progress._format_bytes(size) if size else "?"
+        return "{}/{} {}/s".format(Progress._format_bytes(done),total,Progress._format_bytes(speed))
+
+    def download(self,url,path,sha256=None,sha256_url=None):
+        PrintUtils.print_info("开始下载:{} -> {}".format(url,path))
+        part,state_file = path+".part",path+".part.json"
+        if sha256 is None and sha256_url:
+            name = os.path.basename(urllib.parse.urlsplit(url).path)
+            sha256 = self.checksum(sha256_url,name)
+            if sha256 is None: PrintUtils.print_warn("校验文件中没有{},只检查文件大小".format(name))
+        start_time = time.time()
+        try:
+            size,ranged,validator = self._probe(url)
+        except (OSError,ValueError,http.client.HTTPException) as e:
+            PrintUtils.print_error("下载失败:{}".format(e))
+            return False
+
+        if not ranged or not size:
+            expected = size
+            try:
+                self._fetch_single(url,part)
+            except (OSError,http.client.HTTPException) as e:
+                PrintUtils.print_error("下载失败:{}".format(e))
+                return False
+            size = os.path.getsize(part)
+            # 单线程下载时连接中断read也会正常结束,用Content-Length判断是否下载完整
+            if expected is not None and size!=expected:
+                PrintUtils.print_error("下载不完整({}/{}字节),请重新下载:{}".format(size,expected,url))
+                Downloader._discard(part)
+                return False
+        else:
+            state = self._load_state(state_file,url,size,validator)
+            if state is None or not os.path.exists(part):
+                step = -(-size//self.segments)
+                state = {"url":url,"size":size,"validator":validator,
+                         "segments":[[i,min(i+step,size)-1,0] for i in range(0,size,step)]}
+            else:
+                PrintUtils.print_info("从上次中断的位置继续下载")
+            resumed = sum(segment[2] for segment in state["segments"])
+            lock,stop = threading.Lock(),threading.Event()
+            fd = os.open(part,os.O_WRONLY|os.O_CREAT,0o644)
+            try:
+                os.ftruncate(fd,size)
+                with concurrent.futures.ThreadPoolExecutor(max_workers=len(state["segments"])) as executor:
+                    futures = [executor.submit(self._fetch_segment,url,fd,segment,lock,stop) for segment in state["segments"]]
+                    try:
+                        while not all(future.done() for future in futures):
+                            concurrent.futures.wait(futures,timeout=1)
+                            self._save_state(state_file,state,lock)
+                            with lock:
+                                done = sum(segment[2] for segment in state["segments"])
+                            if renderer.is_interactive():
+                                renderer.get_stream().write("\r\033[34m下载中 {}\033[0m\033[K".format(self._report(done-resumed,size-resumed,start_time)))
+                                renderer.get_stream().flush()
+                    except BaseException:
+                        stop.set()
+                        raise
+                    finally:
+                        self._save_state(state_file,state,lock)
+                ok = all(future.result() for future in futures)
+            finally:
+                os.close(fd)
+            if renderer.is_interactive(): renderer.write("\n",0)
+            if not ok:
+                PrintUtils.print_error("下载失败,已下载的部分会保留,重新运行即可继续下载")
+                return False
+            size -= resumed
+
+        if sha256 and Downloader.sha256sum(part)!=sha256.lower():
+            PrintUtils.print_error("文件校验失败,删除后请重新下载:{}".format(url))
+            Downloader._discard(part,state_file)
+            return False
+        os.replace(part,path)
+        if os.path.exists(state_file): os.remove(state_file)
+        PrintUtils.print_success("下载完成:{}".format(self._report(size,size,start_time)))
+        return True
+
+
 class FileUtils():
+    @staticmethod
+    def download(url,path,sha256=None,segments=4,sha256_url=None):
+        """
+        分段下载到path,失败返回False,参考Downloader
+        """
+        return Downloader(segments=segments).download(url,path,sha256,sha256_url)
+
     @staticmethod
     def delete(path):
         if os.path.exists(path):
-            result = CmdTask("sudo rm -rf {}".format(path),3).run()
+            result = CmdTask("sudo rm -rf {}".format(path)).run()
             return result[0]==0
         return False
 
@@ -1055,9 +2310,7 @@ class FileUtils():
         """
         优先home,没有home提供root
         """
-        bashrc_result = CmdTask("ls /home/*/.bashrc", 0).run()
-        if bashrc_result[0]!=0:  bashrc_result = CmdTask("ls /root/.bashrc", 0).run()
-        return bashrc_result[1]
+        return list(system_facts.bashrc)
 
     @staticmethod
     def exists(path):
@@ -1072,35 +2325,20 @@ class FileUtils():
         """
         优先home,没有home提供root
         """
-        users = CmdTask("users", 0).run()
-        if users[0]!=0:  return ['root']
-        # TODO 使用ls再次获取用户名
-        users = users[1][0].split(" ")
-        if len(users[0])==0:
-            user = input("请手动输入你的用户名>>")
-            users.clear()
-            users.append(user)
-        return users
+        return list(system_facts.users)
 
     @staticmethod
     def getusershome():
         """
         优先home,没有home提供root
         """
-        users = FileUtils.getusers()
-        user_homes = []
-        for user in users:
-            if user=='root':
-                user_homes.append("/root/")
-            else:
-                user_homes.append("/home/"+str(user)+"/")
-        return user_homes
+        return list(system_facts.homes)
 
     @staticmethod
     def new(path,name=None,data=''):
         PrintUtils.print_info("创建文件:{}".format(path+name))
         if not os.path.exists(path):
-            CmdTask("sudo mkdir -p {}".format(path),3).run()
+            CmdTask("sudo mkdir -p {}".format(path)).run()
         if name!=None:
             with open(path+name,"w") as f:
                 f.write(data)
@@ -1181,84 +2419,829 @@ class FileUtils():
 
     @staticmethod
     def check_result(result,patterns):
+        """
+        在命令结果中查找patterns,result可以是(code,out,err)或者行列表,CmdOutput会逐行惰性读取
+        运行中就需要知道结果的,直接给CmdTask传OutputMatcher
+        """
+        matcher = OutputMatcher({'match':patterns})
         for line in result:
-            for pattern in patterns:
-                line = str(line)
-                if len(re.findall(pattern, line))>0:
-                    return True
+            if isinstance(line,CmdOutput):
+                for item in line:
+                    if matcher.feed(item): return True
+            elif matcher.feed(str(line)):
+                return True
+
+class AptScheduler():
+    """
+    apt/dpkg写操作调度
+    - 用fcntl F_GETLK探测dpkg/apt锁文件的持有进程(如unattended-upgrades),探测失败时解析/proc/locks
+    - 锁被占用时显示持有进程并等待,而不是直接运行然后失败
+    - 同一进程内(如CmdTaskExecutor并发)用线程锁,多个同时运行的工具之间用flock,同一时间只运行一个apt/dpkg写操作
+    """
+    lock_files = ["/var/lib/dpkg/lock-frontend","/var/lib/dpkg/lock","/var/lib/apt/lists/lock","/var/cache/apt/archives/lock"]
+    process_lock_file = "/tmp/fishros-apt.lock"
+    write_command = re.compile(r"(?<![\w-])(apt|apt-get|aptitude)(?![\w-])[^;&|]*?\b(install|remove|purge|update|upgrade|full-upgrade|dist-upgrade|autoremove|reinstall|build-dep|autoclean|clean)\b"
+                               r"|(?<![\w-])dpkg\s[^;&|]*?(-i\b|--install|--configure|-r\b|--remove|-P\b|--purge|--unpack|-a\b)"
+                               r"|(?<![\w-])add-apt-repository(?![\w-])")
+
+    def __init__(self,timeout=1800,interval=1) -> None:
+        self.timeout = timeout
+        self.interval = interval
+        self.thread_lock = threading.Lock()
+        self.owner = None
+        self.process_fd = None
+
+    # 会运行dpkg修改已安装软件的命令,不能中途结束
+    dpkg_command = re.compile(r"(?<![\w-])(apt|apt-get|aptitude)(?![\w-])[^;&|]*?\b(install|remove|purge|upgrade|full-upgrade|dist-upgrade|autoremove|reinstall|build-dep)\b"
+                              r"|(?<![\w-])dpkg\s[^;&|]*?(-i\b|--install|--configure|-r\b|--remove|-P\b|--purge|--unpack|-a\b)")
+
+    @staticmethod
+    def is_write_command(command):
+        return AptScheduler.write_command.search(command) is not None
+
+    @staticmethod
+    def is_dpkg_command(command):
+        return AptScheduler.dpkg_command.search(command) is not None
+
+    @staticmethod
+    def _proc_locks_holder(path):
+        try:
+            st = os.stat(path)
+            key = "{:02x}:{:02x}:{}".format(os.major(st.st_dev),os.minor(st.st_dev),st.st_ino)
+            with open("/proc/locks") as f:
+                for line in f:
+                    fields = line.split()
+                    # ->开头的是正在等待锁的进程
+                    if len(fields)>5 and fields[1]!="->" and fields[5]==key: return int(fields[4])
+        except (OSError,ValueError):
+            pass
+        return None
+
+    @staticmethod
+    def lock_holder(path):
+        """
+        持有path锁的进程号,没有进程持有时返回None,持有者在其他pid命名空间时为0
+        """
+        try:
+            fd = os.open(path,os.O_RDONLY)
+        except OSError:
+            return AptScheduler._proc_locks_holder(path)
+        try:
+            flock = fcntl.fcntl(fd,fcntl.F_GETLK,struct.pack("hhqqi",fcntl.F_WRLCK,0,0,0,0))
+            l_type,_,_,_,pid = struct.unpack("hhqqi",flock)
+        except (OSError,struct.error):
+            return AptScheduler._proc_locks_holder(path)
+        finally:
+            os.close(fd)
+        if l_type==fcntl.F_UNLCK: return None
+        return pid
+
+    @staticmethod
+    def holders():
+        """
+        [(锁文件,进程号,进程名)]
+        """
+        result = []
+        for path in AptScheduler.lock_files:
+            pid = AptScheduler.lock_holder(path)
+            if pid is None: continue
+            comm = "unknown"
+            try:
+                with open("/proc/{}/comm".format(pid)) as f:
+                    comm = f.read().strip()
+            except OSError:
+                pass
+            result.append((path,pid,comm))
+        return result
+
+    def wait_unlocked(self):
+        """
+        等待apt/dpkg锁被释放,超时返回False
+        """
+        start = time.time()
+        last = None
+        while True:
+            holders = AptScheduler.holders()
+            if len(holders)==0:
+                if last is not None: renderer.write("\n",0)
+                return True
+            names = sorted(set("{}({})".format(comm,pid) for path,pid,comm in holders))
+            if names!=last:
+                if last is not None: renderer.write("\n",0)
+                PrintUtils.print_warn("apt/dpkg正在被{}使用(如系统自动更新),等待其结束后继续...".format(",".join(names)))
+                last = names
+            waited = time.time()-start
+            if waited>self.timeout:
+                PrintUtils.print_error("\n等待apt/dpkg锁超时({}秒),继续尝试运行".format(self.timeout))
+                return False
+            if renderer.is_interactive():
+                renderer.get_stream().write("\r\033[33m已等待{:.0f}秒,最长等待{}秒\033[0m\033[K".format(waited,self.timeout))
+                renderer.get_stream().flush()
+            time.sleep(self.interval)
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        self.owner = threading.get_ident()
+        try:
+            self.process_fd = os.open(AptScheduler.process_lock_file,os.O_RDWR|os.O_CREAT,0o666)
+            try:
+                fcntl.flock(self.process_fd,fcntl.LOCK_EX|fcntl.LOCK_NB)
+            except BlockingIOError:
+                PrintUtils.print_warn("另一个安装工具正在使用apt,等待其结束后继续...")
+                fcntl.flock(self.process_fd,fcntl.LOCK_EX)
+        except OSError:
+            if self.process_fd is not None: os.close(self.process_fd)
+            self.process_fd = None
+        self.wait_unlocked()
+
+    def release(self):
+        if self.process_fd is not None:
+            os.close(self.process_fd)
+            self.process_fd = None
+        self.owner = None
+        self.thread_lock.release()
+
+    @contextlib.contextmanager
+    def hold(self,command=None):
+        """
+        with apt_scheduler.hold(command): 只有apt/dpkg写操作需要排队,command为None时总是排队
+        """
+        if (command is not None and not AptScheduler.is_write_command(command)) or self.owner==threading.get_ident():
+            yield
+            return
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+apt_scheduler = AptScheduler()
+
+
+class AptIndex():
+    """
+    本地apt包名索引,直接读取当前软件源对应的/var/lib/apt/lists/*_Packages
+    - 流式读取Package:行,只解析一次
+    - 以列表文件的mtime和大小作为缓存key,进程内和磁盘各缓存一份
+    - 按正则查询包名,列表文件无法读取时返回None,由调用方退回apt-cache
+    """
+    lists_dir = "/var/lib/apt/lists"
+
+    def __init__(self,lists_dir=None,cache_file=None) -> None:
+        if lists_dir: self.lists_dir = lists_dir
+        self.cache_file = cache_file
+        self._key = None
+        self._names = None
+
+    def _list_files(self):
+        """
+        只读取当前软件源引用的列表文件(apt-get indextargets),与apt-cache看到的一致
+        已删除或被替换的源留下的旧列表不参与索引,apt太旧不支持indextargets时返回None
+        """
+        try:
+            result = subprocess.run(["apt-get","indextargets","--format","$(FILENAME)","Created-By: Packages"],
+                                    stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,universal_newlines=True)
+        except OSError:
+            return None
+        if result.returncode!=0: return None
+        files = set()
+        for name in result.stdout.split():
+            path = os.path.join(self.lists_dir,os.path.basename(name))
+            if os.path.exists(path): files.add(path)
+            elif os.path.exists(path+".gz"): files.add(path+".gz")
+            # lz4/xz等压缩格式标准库读不了
+            elif glob.glob(path+".*"): return None
+        return sorted(files)
+
+    def _get_key(self,files):
+        key = {}
+        for path in files:
+            stat = os.stat(path)
+            key[path] = [stat.st_mtime,stat.st_size]
+        return key
+
+    def _parse(self,files):
+        names = set()
+        for path in files:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path,"rt",encoding="utf-8",errors="replace") as f:
+                for line in f:
+                    if line.startswith("Package:"): names.add(line[8:].strip())
+        return sorted(names)
+
+    def _load_cache(self,key):
+        if not self.cache_file: return None
+        try:
+            with open(self.cache_file) as f:
+                data = json.load(f)
+        except (OSError,ValueError):
+            return None
+        if data.get("key")!=key: return None
+        return data.get("names")
+
+    def _save_cache(self,key,names):
+        if not self.cache_file: return
+        try:
+            os.makedirs(os.path.dirname(self.cache_file),exist_ok=True)
+            tmp = "{}.{}".format(self.cache_file,os.getpid())
+            with open(tmp,"w") as f:
+                json.dump({"key":key,"names":names},f)
+            os.replace(tmp,self.cache_file)
+        except OSError:
+            pass
+
+    def names(self):
+        """
+        排序后的全部包名,没有可用的列表文件时返回None
+        """
+        try:
+            files = self._list_files()
+            if not files: return None
+            key = self._get_key(files)
+        except OSError:
+            return None
+        if key==self._key: return self._names
+        names = self._load_cache(key)
+        if names is None:
+            try:
+                names = self._parse(files)
+            except (OSError,EOFError):
+                return None
+            self._save_cache(key,names)
+        self._key,self._names = key,names
+        return names
+
+    def search(self,pattern,flags=re.IGNORECASE):
+        names = self.names()
+        if names is None: return None
+        regex = re.compile(pattern,flags)
+        return [name for name in names if regex.search(name)]
+
+apt_index = AptIndex(cache_file=os.path.join(cache_dir,"aptindex.json"))
+
+
+class MirrorProber():
+    """
+    镜像测速
+    - 并发请求每个候选镜像的Release/InRelease文件测延迟,再下载固定大小的样本测吞吐
+    - 测速结果按url持久化,ttl内不再重复测速
+    - 候选镜像由调用方传入,可以指向本地的http.server做测试
+    """
+    def __init__(self,cache_file=None,ttl=6*3600,timeout=3,sample_size=256*1024,max_workers=8) -> None:
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.timeout = timeout
+        self.sample_size = sample_size
+        self.max_workers = max_workers
+
+    def _open(self,url,headers={}):
+        # 只用来测速,不校验证书
+        context = ssl._create_unverified_context() if url.startswith("https") else None
+        request = urllib.request.Request(url,headers=dict(headers,**{"User-Agent":"fishros-install"}))
+        return urllib.request.urlopen(request,timeout=self.timeout,context=context)
+
+    def probe(self,release_url,sample_url=None):
+        """
+        测试单个镜像
+        - release_url: Release/InRelease地址,测延迟(首字节时间)
+        - sample_url: 较大的文件,只下载前sample_size字节测吞吐,为None时使用release_url
+        """
+        score = {"ok":False,"latency":None,"throughput":None,"time":time.time()}
+        try:
+            start = time.perf_counter()
+            with self._open(release_url) as response:
+                response.read(1)
+                score["latency"] = time.perf_counter()-start
+                if sample_url is None:
+                    size = 1+len(response.read(self.sample_size-1))
+                    score["throughput"] = size/max(time.perf_counter()-start,1e-6)
+            if sample_url is not None:
+                start = time.perf_counter()
+                with self._open(sample_url,{"Range":"bytes=0-{}".format(self.sample_size-1)}) as response:
+                    size = len(response.read(self.sample_size))
+                score["throughput"] = size/max(time.perf_counter()-start,1e-6)
+            score["ok"] = True
+        except (OSError,ValueError,http.client.HTTPException):
+            pass
+        return score
+
+    @staticmethod
+    def cost(score,sample_size=1024*1024):
+        """预计下载sample_size字节的耗时,越小越好"""
+        if not score or not score.get("ok"): return float("inf")
+        if not score.get("throughput"): return score["latency"]
+        return score["latency"]+sample_size/score["throughput"]
+
+    def _load(self):
+        if not self.cache_file: return {}
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (OSError,ValueError):
+            return {}
+
+    def _save(self,scores):
+        if not self.cache_file: return
+        try:
+            os.makedirs(os.path.dirname(self.cache_file),exist_ok=True)
+            tmp = "{}.{}".format(self.cache_file,os.getpid())
+            with open(tmp,"w") as f:
+                json.dump(scores,f)
+            os.replace(tmp,self.cache_file)
+        except OSError:
+            pass
+
+    def rank(self,candidates,use_cache=True):
+        """
+        测速并排序
+        - candidates: {name:(release_url,sample_url)},sample_url可以为None
+        - 返回按预计耗时排序的[(name,score)],不可用的镜像排在最后,保持传入顺序
+        """
+        scores = self._load()
+        now = time.time()
+        todo = {}
+        for name,(release_url,sample_url) in candidates.items():
+            cached = scores.get(release_url)
+            if not use_cache or not cached or now-cached.get("time",0)>self.ttl:
+                todo[name] = (release_url,sample_url)
+        if len(todo)>0:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers,len(todo))) as executor:
+                futures = {name:executor.submit(self.probe,*urls) for name,urls in todo.items()}
+            for name,future in futures.items():
+                scores[todo[name][0]] = future.result()
+            self._save(scores)
+        result = [(name,scores.get(candidates[name][0])) for name in candidates]
+        return sorted(result,key=lambda item: MirrorProber.cost(item[1]))
+
+mirror_prober = MirrorProber(cache_file=os.path.join(cache_dir,"mirrors.json"))
+
+
+class AptFreshness():
+    """
+    apt索引新鲜度
+    - 对sources.list、sources.list.d下的每个源文件以及mirror+file:引用的镜像列表求hash,记录上次apt update成功的时间
+    - 源文件集合和内容都没有变化且距上次更新不超过ttl秒时,不必再次apt update
+    """
+    sources_file = "/etc/apt/sources.list"
+    sources_dir = "/etc/apt/sources.list.d"
+    mirror_dir = "/etc/apt/fishros-mirrors"
+
+    def __init__(self,stamp_file,ttl=3600) -> None:
+        self.stamp_file = stamp_file
+        self.ttl = ttl
+
+    def source_files(self):
+        files = [AptFreshness.sources_file]
+        files += sorted(glob.glob(os.path.join(AptFreshness.sources_dir,"*.list")))
+        files += sorted(glob.glob(os.path.join(AptFreshness.sources_dir,"*.sources")))
+        # 镜像列表的顺序决定apt使用哪个镜像,调整顺序后也需要更新
+        files += sorted(glob.glob(os.path.join(AptFreshness.mirror_dir,"*.list")))
+        return [path for path in files if os.path.isfile(path)]
+
+    def source_hashes(self):
+        hashes = {}
+        for path in self.source_files():
+            try:
+                with open(path,"rb") as f:
+                    hashes[path] = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                hashes[path] = None
+        return hashes
+
+    def load(self):
+        try:
+            with open(self.stamp_file) as f:
+                return json.load(f)
+        except (OSError,ValueError):
+            return {}
+
+    def changed_files(self,hashes=None):
+        """
+        上次更新后新增、修改或者删除的源文件
+        """
+        if hashes is None: hashes = self.source_hashes()
+        old = self.load().get("sources",{})
+        changed = [path for path in hashes if old.get(path)!=hashes[path]]
+        return changed+[path for path in old if path not in hashes]
+
+    def update_targets(self,changed):
+        """
+        变化的文件只涉及sources.list.d中的源文件和镜像列表时,返回需要单独更新的源文件,否则返回None(需要完整更新)
+        - 镜像列表变化时更新引用它的源文件
+        - 删除了源文件或者修改了sources.list需要完整更新
+        """
+        targets = []
+        for path in changed:
+            if not os.path.isfile(path): return None
+            directory = os.path.dirname(path)
+            if directory==AptFreshness.sources_dir:
+                if path not in targets: targets.append(path)
+            elif directory==AptFreshness.mirror_dir:
+                for source in self.source_files():
+                    if os.path.dirname(source)!=AptFreshness.sources_dir: continue
+                    try:
+                        with open(source,encoding="utf-8",errors="replace") as f:
+                            if path in f.read() and source not in targets: targets.append(source)
+                    except OSError:
+                        return None
+            else:
+                return None
+        return targets
+
+    def is_recent(self):
+        """
+        ttl内完整更新过,且索引文件还在
+        """
+        if time.time()-self.load().get("time",0)>self.ttl: return False
+        # 索引被清理过(如docker镜像)时需要重新更新
+        return len(glob.glob(os.path.join(AptIndex.lists_dir,"*_Packages*")))>0
+
+    def is_fresh(self):
+        return self.is_recent() and self.load().get("sources")==self.source_hashes()
+
+    def mark_updated(self,hashes=None,update_time=None):
+        if hashes is None: hashes = self.source_hashes()
+        if update_time is None: update_time = time.time()
+        try:
+            os.makedirs(os.path.dirname(self.stamp_file),exist_ok=True)
+            tmp = "{}.{}".format(self.stamp_file,os.getpid())
+            with open(tmp,"w") as f:
+                json.dump({"time":update_time,"sources":hashes},f)
+            os.replace(tmp,self.stamp_file)
+        except OSError:
+            pass
+
+    def mark_file_updated(self,*paths):
+        """
+        只更新了部分源文件,记录这些文件的hash,完整更新的时间保持不变
+        """
+        stamp = self.load()
+        sources = stamp.get("sources",{})
+        hashes = self.source_hashes()
+        for path in paths: sources[path] = hashes.get(path)
+        self.mark_updated(sources,stamp.get("time",0))
+
+apt_freshness = AptFreshness(os.path.join(cache_dir,"apt-update.json"))
+
 
 class AptUtils():
     @staticmethod
-    def checkapt():
-        result = CmdTask('sudo apt update',100).run()
+    def checkapt(timeout=100,force=False):
+        """
+        - timeout: apt update的时间预算,超时视为更新失败
+        - force: 为False时,源没有变化且不久前更新过则跳过apt update,换源后应传入True
+        """
+        hashes = apt_freshness.source_hashes()
+        if apt_freshness.is_recent():
+            changed = apt_freshness.changed_files(hashes)
+            if not force and len(changed)==0:
+                PrintUtils.print_info("软件源没有变化且近期已更新,跳过apt update")
+                return True
+            # 近期完整更新过,只是sources.list.d中新增、修改了源文件(如换源重试时重写ros-fish.list)时只更新这些文件
+            # 被替换掉的旧镜像的列表会留在lists中,AptIndex只读取当前源引用的列表,不影响搜索
+            targets = apt_freshness.update_targets(changed)
+            if len(changed)>0 and targets is not None:
+                for path in targets:
+                    if not AptUtils.update_source_file(path,timeout): return False
+                apt_freshness.mark_file_updated(*changed)
+                return True
+        matcher = OutputMatcher.apt(abort_on=['certificate_error'])
+        result = CmdTask('sudo apt update',timeout,matcher=matcher).run()
         if result[0]!=0:
-            if FileUtils.check_result(result,['certificate','证书']):
+            if matcher.has('certificate_error'):
                 PrintUtils.print_warn("检测到发生证书校验错误{}，自动取消https校验，如有需要请手动删除：rm /etc/apt/apt.conf.d/99verify-peer.conf".format(result[2]))
                 CmdTask('touch /etc/apt/apt.conf.d/99verify-peer.conf').run()
                 CmdTask('echo  "Acquire { https::Verify-Peer false }" > /etc/apt/apt.conf.d/99verify-peer.conf').run()
                 CmdTask("sudo apt-key adv --keyserver keyserver.ubuntu.com --recv-keys F42ED6FBAB17C654",10).run()
-                result = CmdTask('sudo apt update',100).run()
+                result = CmdTask('sudo apt update',timeout).run()
         if result[0]!=0:
             PrintUtils.print_warn("apt更新失败,后续程序可能会继续尝试...,{}".format(result[2]))
             return False
+        apt_freshness.mark_updated(hashes)
+        return True
+
+    @staticmethod
+    def apt_version():
+        """
+        从dpkg状态文件读取apt的版本,如(2,4),读取失败返回None
+        """
+        try:
+            with open("/var/lib/dpkg/status",encoding="utf-8",errors="replace") as f:
+                package = None
+                for line in f:
+                    if line.startswith("Package:"): package = line[8:].strip()
+                    elif package=="apt" and line.startswith("Version:"):
+                        version = re.match(r"(?:\d+:)?(\d+)\.(\d+)",line[8:].strip())
+                        if version: return (int(version.group(1)),int(version.group(2)))
+                        return None
+        except OSError:
+            pass
+        return None
+
+    @staticmethod
+    def support_mirror_file():
+        """
+        apt 1.6开始支持mirror+file:,一次更新/安装中按镜像列表逐个文件切换镜像
+        """
+        version = AptUtils.apt_version()
+        return version is not None and version>=(1,6)
+
+    mirror_list_dir = AptFreshness.mirror_dir+"/"
+
+    @staticmethod
+    def write_mirror_list(name,urls):
+        """
+        生成镜像列表文件,返回用于源文件的mirror+file:地址
+        - urls: 按优先级排序的镜像地址
+        """
+        FileUtils.new(AptUtils.mirror_list_dir,name+".list","".join(url+"\n" for url in urls))
+        return "mirror+file:"+AptUtils.mirror_list_dir+name+".list"
+
+    @staticmethod
+    def update_source_file(path,timeout=100):
+        """
+        只更新单个源文件的索引,其他源的索引保持不变
+        - Dir::Etc::sourcelist指定源文件,sourceparts=-不读取sources.list.d
+        - List-Cleanup=0保留其他源已经下载的索引,否则apt会把其他源的列表当作无用文件删除
+        - 因此不会清理旧镜像的列表,它们只占用空间: AptIndex只读取当前源引用的列表,下次完整更新时由apt清理
+        """
+        result = CmdTask("sudo apt-get update -o Dir::Etc::sourcelist={} -o Dir::Etc::sourceparts=- -o APT::Get::List-Cleanup=0".format(path),timeout).run()
+        if result[0]!=0:
+            PrintUtils.print_warn("更新{}失败,{}".format(path,result[2]))
+            return False
+        apt_freshness.mark_file_updated(path)
         return True
 
     @staticmethod
     def getArch():
-        result = CmdTask("dpkg --print-architecture",2).run()
-        arc = result[1][0].strip("\n")
+        arc = system_facts.arch
         if arc=='armhf': arc = 'arm64'
-        if result[0]==0: return arc
+        if arc: return arc
         PrintUtils.print_error("小鱼提示:自动获取系统架构失败...请手动选择")
         # @TODO 提供架构选项 amd64,i386,arm
         return None
 
     @staticmethod
     def search_package(name,pattern,replace1="",replace2=""):
-        result = CmdTask("sudo apt-cache search {} ".format(name),20).run()
-        if result[0]!=0:
-            PrintUtils.print_error("搜索不到任何{}相关的包".format(name))
-            return None
+        """
+        在包名中搜索name,再用pattern提取,优先使用本地索引apt_index,不可用时使用apt-cache search
+        """
+        lines = apt_index.search(name)
+        if lines is None:
+            result = CmdTask("sudo apt-cache search {} ".format(name),20).run()
+            if result[0]!=0:
+                PrintUtils.print_error("搜索不到任何{}相关的包".format(name))
+                return None
+            lines = result[1]
         dic = {}
-        for line in result[1]:
+        for line in lines:
             temp = re.findall(pattern,line)
             if len(temp)>0: dic[temp[0].replace(replace1,"").replace(replace2,"")] = temp[0]
         if len(dic)==0: return None
         return dic
 
     @staticmethod
-    def install_pkg(name,apt_tool="apt",auto_yes=True,os_command=False):
-        dic = AptUtils().search_package(name,name)
-        yes = ""
-        if auto_yes:
-            yes="-y"
-
-        result = None
-        for key in dic.keys():
-            result = CmdTask("sudo {} install {} {}".format(apt_tool,dic[key],yes), 0, os_command=os_command).run()
-        if not result:
+    def install_pkg(name,apt_tool="apt",auto_yes=True,os_command=False,matcher=None,tee=False):
+        """
+        安装包名匹配name的包,匹配到多个包时也只调用一次apt,参考AptTransaction
+        """
+        dic = AptUtils.search_package(name,name)
+        if not dic:
             PrintUtils.print_warn("没有找到包：{}".format(name))
-        return result
+            return None
+        return AptTransaction(apt_tool,auto_yes).add(*dic.values()).commit(os_command=os_command,matcher=matcher,tee=tee)
 
     @staticmethod
     def install_pkg_check_dep(name):
         """
         安装并检查依赖问题
         """
-        result = AptUtils.install_pkg(name)
+        # 依赖问题在apt解析阶段就会输出,此时还没有开始安装,可以直接结束
+        matcher = OutputMatcher.apt(abort_on=['unmet_dependency'])
+        result = AptUtils.install_pkg(name,matcher=matcher)
         if result:
             # 自动同意安装一次
             AptUtils.install_pkg('aptitude')
-            if FileUtils.check_result(result,['未满足的依赖关系','unmet dependencies']):
-                result = AptUtils.install_pkg(name,apt_tool="aptitude", os_command = False, auto_yes=True)
+            if matcher.has('unmet_dependency'):
+                matcher = OutputMatcher.apt()
+                result = AptUtils.install_pkg(name,apt_tool="aptitude", os_command = False, auto_yes=True, matcher=matcher)
             # 还不行让用户手动安装
-            while FileUtils.check_result(result,['未满足的依赖关系','unmet dependencies']):
+            if matcher.has('unmet_dependency'): install_plan.require_interactive("aptitude解决{}的依赖问题".format(name))
+            while matcher.has('unmet_dependency'):
                 # 尝试使用aptitude解决依赖问题
                 PrintUtils.print_warn("============================================================")
                 PrintUtils.print_delay("请注意我，检测你在安装过程中出现依赖问题，请在稍后选择解决方案（第一个解决方案不一定可以解决问题，如再遇到可以采用下一个解决方案）,即可解决")
-                input("确认了解上述情况，请输入回车继续安装")
-                result = AptUtils.install_pkg(name,apt_tool="aptitude", os_command = True, auto_yes=False)
-                result = AptUtils.install_pkg(name,apt_tool="aptitude", os_command = False, auto_yes=True)
+                InputTask("确认了解上述情况，请输入回车继续安装",key="apt.aptitude_confirm").run()
+                matcher = OutputMatcher.apt()
+                result = AptUtils.install_pkg(name,apt_tool="aptitude", auto_yes=False, matcher=matcher, tee=True)
+
+    @staticmethod
+    def install_pkgs(names,apt_tool="apt",auto_yes=True,os_command=False,matcher=None,tee=False):
+        """
+        一次apt调用安装多个包,参考AptTransaction
+        """
+        return AptTransaction(apt_tool,auto_yes).add(*names).commit(os_command=os_command,matcher=matcher,tee=tee)
+
+
+class AptTransaction():
+    """
+    批量apt安装
+    - add只记录包名,commit时一次apt-cache policy解析全部包,再用一次apt install完成安装
+      依赖解析,dpkg锁和man-db/ldconfig等触发器都只执行一次
+    - 已是最新版本的包直接跳过,找不到的包给出提示
+    - 整体安装失败时逐个安装,避免一个包拖累其他包
+    - 模块中的apt_transaction用于在一个工具内攒批,工具在需要这些包之前自行commit
+      最外层工具成功结束时提交剩下的包,工具失败或抛出异常时丢弃
+    - options: 额外的apt -o参数,如只使用指定的源文件
+    """
+    def __init__(self,apt_tool="apt",auto_yes=True,options="") -> None:
+        self.apt_tool = apt_tool
+        self.auto_yes = auto_yes
+        self.options = options
+        self.names = []
+
+    def add(self,*names):
+        for name in names:
+            if name and name not in self.names: self.names.append(name)
+        return self
+
+    def __len__(self):
+        return len(self.names)
+
+    def discard(self):
+        self.names = []
+
+    def resolve(self):
+        """
+        返回(需要安装的包,找不到的包),已安装最新版本的包不再安装
+        """
+        if len(self.names)==0: return [],[]
+        result = CmdTask("LANG=C apt-cache {} policy {}".format(self.options," ".join(self.names)),20).run()
+        policy = {}
+        name = None
+        for line in result[1]:
+            if line and not line[0].isspace() and line.endswith(":"):
+                name = line[:-1]
+                policy[name] = {}
+            elif name and ":" in line:
+                key,value = line.strip().split(":",1)
+                policy[name][key] = value.strip()
+        pkgs,missing = [],[]
+        for name in self.names:
+            info = policy.get(name)
+            if info is None or info.get("Candidate","(none)")=="(none)":
+                missing.append(name)
+            elif info.get("Installed")!=info.get("Candidate"):
+                pkgs.append(name)
+        return pkgs,missing
+
+    def commit(self,os_command=False,matcher=None,tee=False):
+        """
+        安装全部包并清空记录
+        - 返回最后一次CmdTask的结果,都已是最新版本时返回(0,[],[]),一个包都找不到时返回None
+        """
+        if len(self.names)==0: return None
+        pkgs,missing = self.resolve()
+        found = len(self.names)-len(missing)
+        self.names = []
+        for name in missing:
+            PrintUtils.print_warn("没有找到包：{}".format(name))
+        if found==0: return None
+        if len(pkgs)==0: return (0,[],[])
+
+        yes = "-y" if self.auto_yes else ""
+        result = CmdTask("sudo {} {} install {} {}".format(self.apt_tool,self.options," ".join(pkgs),yes), 0, os_command=os_command, matcher=matcher, tee=tee).run()
+        if result[0]!=0 and len(pkgs)>1 and not os_command:
+            PrintUtils.print_warn("批量安装失败,逐个安装:{}".format(" ".join(pkgs)))
+            for pkg in pkgs:
+                result = CmdTask("sudo {} {} install {} {}".format(self.apt_tool,self.options,pkg,yes), 0, matcher=matcher, tee=tee).run()
+        return result
+
+apt_transaction = AptTransaction()
+
+
+class AptBundle():
+    """
+    离线deb包(本地平铺仓库)
+    - export: 收集已安装包及其依赖闭包的deb文件,优先从/var/cache/apt/archives复制,没有的使用apt-get download下载,
+      再生成Packages索引和bundle.json清单
+    - install: 以[trusted=yes] file:源只更新该源,并只使用该源安装,全程不需要网络
+    """
+    archives_dir = "/var/cache/apt/archives"
+    list_file = "/etc/apt/sources.list.d/fishros-bundle.list"
+    manifest_name = "bundle.json"
+
+    def __init__(self,path) -> None:
+        self.path = os.path.abspath(path)
+
+    @staticmethod
+    def installed_packages():
+        """
+        已安装的包 {name:(version,arch)}
+        """
+        output = subprocess.run(["dpkg-query","-W","-f","${Package}\t${Version}\t${Architecture}\t${db:Status-Abbrev}\n"],
+                                stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,universal_newlines=True).stdout
+        installed = {}
+        for line in output.splitlines():
+            fields = line.split("\t")
+            if len(fields)==4 and fields[3].startswith("ii"): installed[fields[0]] = (fields[1],fields[2])
+        return installed
+
+    @staticmethod
+    def dependency_closure(names):
+        """
+        names及其递归依赖中已安装的包 {name:(version,arch)}
+        """
+        result = CmdTask("apt-cache depends --recurse --no-recommends --no-suggests --no-conflicts --no-breaks --no-replaces --no-enhances {}".format(" ".join(names)),60).run()
+        installed = AptBundle.installed_packages()
+        closure = {}
+        for line in list(names)+list(result[1]):
+            name = line.strip()
+            # 缩进的是依赖关系,<>包起来的是虚包
+            if not name or line[0].isspace() or name.startswith("<"): continue
+            name = name.split(":")[0]
+            if name in installed: closure[name] = installed[name]
+        return closure
+
+    @staticmethod
+    def deb_name(name,version,arch):
+        return "{}_{}_{}.deb".format(name,version.replace(":","%3a"),arch)
+
+    def export(self,names):
+        """
+        导出names的离线包,返回是否成功
+        """
+        closure = AptBundle.dependency_closure(names)
+        missing = [name for name in names if name not in closure]
+        if len(missing)>0:
+            PrintUtils.print_error("以下包没有安装,无法导出:{}".format(" ".join(missing)))
+            return False
+        os.makedirs(self.path,exist_ok=True)
+        PrintUtils.print_info("共{}个包,开始收集deb文件到{}".format(len(closure),self.path))
+        download = []
+        for name,(version,arch) in closure.items():
+            deb = AptBundle.deb_name(name,version,arch)
+            if os.path.exists(os.path.join(self.path,deb)): continue
+            if os.path.exists(os.path.join(AptBundle.archives_dir,deb)):
+                shutil.copyfile(os.path.join(AptBundle.archives_dir,deb),os.path.join(self.path,deb))
+            else:
+                download.append("{}={}".format(name,version))
+        if len(download)>0:
+            PrintUtils.print_info("缓存中没有{}个包,开始下载".format(len(download)))
+            result = CmdTask("cd {} && apt-get download {}".format(self.path," ".join(download)),0).run()
+            if result[0]!=0:
+                PrintUtils.print_error("下载失败:{}".format(result[2]))
+                return False
+        self.write_index()
+        with open(os.path.join(self.path,AptBundle.manifest_name),"w") as f:
+            json.dump({"packages":list(names),"codename":osversion.get_codename(),"arch":system_facts.arch,"time":time.time(),"count":len(closure)},f,indent=2)
+        PrintUtils.print_success("离线包导出完成:{}".format(self.path))
+        return True
+
+    def write_index(self):
+        """
+        为目录下的deb生成Packages和Packages.gz
+        """
+        entries = []
+        for deb in sorted(glob.glob(os.path.join(self.path,"*.deb"))):
+            control = subprocess.run(["dpkg-deb","-f",deb],stdout=subprocess.PIPE,universal_newlines=True).stdout.rstrip("\n")
+            md5,sha256 = hashlib.md5(),hashlib.sha256()
+            with open(deb,"rb") as f:
+                for chunk in iter(lambda: f.read(1024*1024),b""):
+                    md5.update(chunk)
+                    sha256.update(chunk)
+            entries.append("{}\nFilename: ./{}\nSize: {}\nMD5sum: {}\nSHA256: {}\n".format(
+                control,os.path.basename(deb),os.path.getsize(deb),md5.hexdigest(),sha256.hexdigest()))
+        data = "\n".join(entries)
+        with open(os.path.join(self.path,"Packages"),"w") as f:
+            f.write(data)
+        with gzip.open(os.path.join(self.path,"Packages.gz"),"wt") as f:
+            f.write(data)
+
+    def manifest(self):
+        try:
+            with open(os.path.join(self.path,AptBundle.manifest_name)) as f:
+                return json.load(f)
+        except (OSError,ValueError):
+            return None
+
+    def install(self,names=None):
+        """
+        从离线包安装,names为None时安装清单中的包
+        """
+        manifest = self.manifest()
+        if manifest is None:
+            PrintUtils.print_error("{}不是有效的离线包".format(self.path))
+            return None
+        if manifest.get("codename")!=osversion.get_codename() or manifest.get("arch")!=system_facts.arch:
+            PrintUtils.print_warn("离线包来自{}/{},当前系统为{}/{},可能无法安装".format(manifest.get("codename"),manifest.get("arch"),osversion.get_codename(),system_facts.arch))
+        FileUtils.new(os.path.dirname(AptBundle.list_file)+"/",os.path.basename(AptBundle.list_file),"deb [trusted=yes] file:{} ./\n".format(self.path))
+        try:
+            if not AptUtils.update_source_file(AptBundle.list_file): return None
+            options = "-o Dir::Etc::sourcelist={} -o Dir::Etc::sourceparts=-".format(AptBundle.list_file)
+            return AptTransaction("apt-get",options=options).add(*(names or manifest["packages"])).commit()
+        finally:
+            FileUtils.delete(AptBundle.list_file)
 
 """
 定义基础任务
@@ -1289,28 +3272,387 @@ class BaseTool():
         pass
         # PrintUtils.print_delay("一键安装已开源，欢迎给个star/提出问题/帮助完善：https://github.com/fishros/install/ ")
 
+# install.py加载了tools.zip时,base.py和各个工具直接从zip中导入,不需要再逐个下载
+bundle_files = set()
+if isinstance(globals().get("__loader__"),zipimport.zipimporter):
+    with zipfile.ZipFile(__loader__.archive) as bundle:
+        bundle_files = set(bundle.namelist())
+
+def in_bundle(url):
+    return "tools/{}".format(url[url.rfind('/')+1:]) in bundle_files
+
+tool_depth = 0
+
 def run_tool_file(file,autorun=True):
     """运行工具文件，可以获取其他工具的对象"""
     import importlib
     tool = importlib.import_module(file.replace(".py","")).Tool()
     if not autorun: return tool
-    if tool.init()==False: return False
-    if tool.run()==False: return False
-    if tool.uninit()==False: return False
+    global tool_depth
+    tool_depth += 1
+    ok = False
+    try:
+        if tool.init()==False: return False
+        if tool.run()==False: return False
+        if tool.uninit()==False: return False
+        ok = True
+    finally:
+        tool_depth -= 1
+        # 最外层工具成功结束时提交工具没有提交的包,失败时不再安装
+        if tool_depth==0 and len(apt_transaction)>0:
+            if ok: apt_transaction.commit()
+            else: apt_transaction.discard()
     return tool
 
 def run_tool_url(url,url_prefix):
-    os.system("wget {} -O /tmp/fishinstall/tools/{} --no-check-certificate".format(url,url[url.rfind('/')+1:]))
+    path = "/tmp/fishinstall/tools/{}".format(url[url.rfind('/')+1:])
+    if not in_bundle(url) and not tool_prefetcher.fetch(url,path) and not script_cache.offline:
+        os.system("wget {} -O {} --no-check-certificate".format(url,path))
     run_tool_file(url.replace(url_prefix,'').replace("/","."))
 
+class ScriptCache():
+    """
+    工具脚本缓存,跨次运行保留(/tmp/fishinstall每次运行结束都会被删除)
+    - objects/<sha256>按内容存放,index.json记录url对应的sha256和ETag/Last-Modified
+    - ttl秒内检查过的脚本直接使用缓存,超过后带If-None-Match/If-Modified-Since重新验证,未变化时服务端只返回304
+    - 网络不可用时使用缓存中的旧版本
+    - 环境变量FISHROS_OFFLINE不为0时只使用缓存,不访问网络
+    install.py中有一份精简的实现用于下载base.py,两者共用同一份索引
+    install.py本身由install脚本缓存为同一目录下的install.py,离线或者下载失败时使用
+    """
+    def __init__(self,root,ttl=600) -> None:
+        self.root = root
+        self.ttl = ttl
+        self.offline = os.environ.get("FISHROS_OFFLINE","0") not in ("","0")
+        self.lock = threading.Lock()
+
+    @property
+    def index_file(self):
+        return os.path.join(self.root,"index.json")
+
+    def object_path(self,digest):
+        return os.path.join(self.root,"objects",digest)
+
+    @staticmethod
+    def write(path,data):
+        """先写临时文件再替换"""
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        tmp = "{}.{}.{}".format(path,os.getpid(),threading.get_ident())
+        try:
+            with open(tmp,"wb") as f:
+                f.write(data)
+            os.replace(tmp,path)
+        finally:
+            if os.path.exists(tmp): os.remove(tmp)
+
+    def _load(self):
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except (OSError,ValueError):
+            return {}
+
+    def _update(self,url,entry):
+        with self.lock:
+            index = self._load()
+            index[url] = entry
+            try:
+                ScriptCache.write(self.index_file,json.dumps(index).encode("utf-8"))
+            except OSError:
+                pass
+
+    def lookup(self,url):
+        """返回(索引项,缓存内容),内容缺失或者与hash不符时为None"""
+        entry = self._load().get(url,{})
+        if not entry.get("sha256"): return entry,None
+        try:
+            with open(self.object_path(entry["sha256"]),"rb") as f:
+                data = f.read()
+        except OSError:
+            return entry,None
+        if hashlib.sha256(data).hexdigest()!=entry["sha256"]: return entry,None
+        return entry,data
+
+    def store(self,url,data,headers):
+        digest = hashlib.sha256(data).hexdigest()
+        try:
+            if not os.path.exists(self.object_path(digest)): ScriptCache.write(self.object_path(digest),data)
+        except OSError:
+            return
+        self._update(url,{"sha256":digest,"etag":headers.get("ETag"),"last_modified":headers.get("Last-Modified"),"time":time.time()})
+
+    def fetch(self,url,path,request):
+        """
+        把url对应的脚本写到path
+        - request(url,headers)返回(status,headers,data),失败时抛出OSError
+        """
+        entry,data = self.lookup(url)
+        if data is not None and (self.offline or time.time()-entry.get("time",0)<self.ttl):
+            ScriptCache.write(path,data)
+            return True
+        if self.offline: raise OSError("离线模式下缓存中没有{}".format(url))
+        headers = {}
+        if data is not None and entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if data is not None and entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            status,response_headers,body = request(url,headers)
+            if status not in (200,304) or (status==304 and data is None): raise OSError("{}: HTTP {}".format(url,status))
+        except OSError as e:
+            if data is None: raise
+            PrintUtils.print_warn("{},使用缓存中的版本".format(e))
+            ScriptCache.write(path,data)
+            return True
+        if status==304:
+            body = data
+            response_headers = {"ETag":entry.get("etag"),"Last-Modified":entry.get("last_modified")}
+        self.store(url,body,response_headers)
+        ScriptCache.write(path,body)
+        return True
+
+script_cache = ScriptCache(cache_dir)
+
+
+class ToolPrefetcher():
+    """
+    工具脚本预取
+    - 每个线程持有到各个主机的长连接(keep-alive),多个脚本复用同一个TCP/TLS连接
+    - 先写入临时文件再os.replace,不会留下下载了一半的脚本
+    - 指定cache时经过ScriptCache,未变化的脚本不再重复下载
+    - 并发下载由ToolScheduler的download步骤完成,每个步骤调用fetch
+    """
+    def __init__(self,timeout=10,retry=2,cache=None) -> None:
+        self.timeout = timeout
+        self.retry = retry
+        self.cache = cache
+        self.local = threading.local()
+
+    def _pool(self):
+        if not hasattr(self.local,"pool"): self.local.pool = {}
+        return self.local.pool
+
+    def _connection(self,scheme,host):
+        pool = self._pool()
+        if (scheme,host) not in pool:
+            if scheme=="https":
+                # 与wget --no-check-certificate保持一致
+                pool[(scheme,host)] = http.client.HTTPSConnection(host,timeout=self.timeout,context=ssl._create_unverified_context())
+            else:
+                pool[(scheme,host)] = http.client.HTTPConnection(host,timeout=self.timeout)
+        return pool[(scheme,host)]
+
+    def _drop(self,scheme,host):
+        conn = self._pool().pop((scheme,host),None)
+        if conn: conn.close()
+
+    def request(self,url,headers=None,redirects=3):
+        """返回(status,headers,data),连接失败时抛出OSError"""
+        parsed = urllib.parse.urlsplit(url)
+        path = (parsed.path or "/")+("?"+parsed.query if parsed.query else "")
+        for attempt in range(self.retry+1):
+            conn = self._connection(parsed.scheme,parsed.netloc)
+            try:
+                conn.request("GET",path,headers=dict({"User-Agent":"fishros-install"},**(headers or {})))
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (OSError,http.client.HTTPException) as e:
+                # 服务端可能已经关闭了空闲的连接,重新建立后再试
+                self._drop(parsed.scheme,parsed.netloc)
+                if attempt==self.retry: raise OSError("{}: {}".format(url,e))
+        if response.will_close: self._drop(parsed.scheme,parsed.netloc)
+        location = response.getheader("Location")
+        if response.status in (301,302,303,307,308) and location and redirects>0:
+            return self.request(urllib.parse.urljoin(url,location),headers,redirects-1)
+        return response.status,response.headers,data
+
+    def get(self,url):
+        """返回响应内容,失败时抛出OSError"""
+        status,headers,data = self.request(url)
+        if status!=200: raise OSError("{}: HTTP {}".format(url,status))
+        return data
+
+    def fetch(self,url,path):
+        """下载url到path,成功返回True"""
+        try:
+            if self.cache: return self.cache.fetch(url,path,self.request)
+            ScriptCache.write(path,self.get(url))
+            return True
+        except OSError as e:
+            PrintUtils.print_warn("下载{}失败:{}".format(url,e))
+            return False
+
+tool_prefetcher = ToolPrefetcher(cache=script_cache)
+
+
+class ToolScheduler():
+    """
+    工具依赖调度
+    - 根据tools注册表中的dep构建依赖图,共享的依赖只处理一次,检测到环时断开成环的那条边
+    - 每个步骤属于一个资源类别,同一类别最多同时运行limits[类别]个,下载可以并行
+    - inline中的类别(运行工具,会调用apt并需要交互)在调用线程中逐个运行,天然串行
+    - 运行结束后输出关键路径耗时
+    """
+    limits = {"download":4}
+    inline = ("tool",)
+
+    def __init__(self,tools,url_prefix=None,limits=None) -> None:
+        self.tools = tools
+        self.url_prefix = url_prefix
+        self.limits = dict(ToolScheduler.limits,**(limits or {}))
+        self.edges = {}
+        self.cycles = []
+        self.steps = {}
+
+    def resolve(self,root):
+        """返回root及其全部依赖的拓扑序(依赖在前)"""
+        order,state = [],{}
+        def visit(id,path):
+            state[id] = "visiting"
+            self.edges[id] = []
+            for dep in self.tools[id].get('dep',[]):
+                if dep not in self.tools:
+                    PrintUtils.print_warn("工具{}的依赖{}不存在,已忽略".format(id,dep))
+                elif state.get(dep)=="visiting":
+                    cycle = path[path.index(dep):]+[dep]
+                    self.cycles.append(cycle)
+                    PrintUtils.print_warn("检测到循环依赖{},已忽略{}->{}".format("->".join(map(str,cycle)),id,dep))
+                else:
+                    self.edges[id].append(dep)
+                    if dep not in state: visit(dep,path+[dep])
+            state[id] = "done"
+            order.append(id)
+        visit(root,[root])
+        return order
+
+    def closure(self,id):
+        """id及其全部依赖(去重)"""
+        result,todo = [],[id]
+        while todo:
+            item = todo.pop()
+            if item in result: continue
+            result.append(item)
+            todo += self.edges.get(item,[])
+        return result
+
+    def add(self,name,resource,fn,deps=()):
+        self.steps[name] = {"resource":resource,"fn":fn,"deps":list(deps),"start":None,"end":None,"result":None}
+
+    def download_step(self,id):
+        url = self.tools[id]['tool']
+        if not url or in_bundle(url): return None
+        name = "download:{}".format(url[url.rfind('/')+1:])
+        if name not in self.steps:
+            path = "/tmp/fishinstall/tools/{}".format(url[url.rfind('/')+1:])
+            cmd = "wget {} -O {} -q --no-check-certificate".format(url,path)
+            # 下载线程复用tool_prefetcher的长连接,失败时回退到wget
+            self.add(name,"download",lambda: tool_prefetcher.fetch(url,path) or (not script_cache.offline and os.system(cmd)==0))
+        return name
+
+    def run_step(self,id,run_deps=False):
+        """运行工具前需要下载好它的全部依赖,run_deps时还要先运行各个依赖"""
+        name = "run:{}".format(id)
+        if name in self.steps: return name
+        deps = [self.download_step(item) for item in self.closure(id)]
+        deps = [dep for dep in deps if dep]
+        if run_deps: deps += [self.run_step(dep,True) for dep in self.edges[id]]
+        url = self.tools[id]['tool']
+        fn = lambda: True
+        if url: fn = lambda: run_tool_file(url.replace(self.url_prefix,'').replace("/","."))!=False
+        self.add(name,"tool",fn,deps)
+        return name
+
+    def plan(self,root,run=False,run_deps=False):
+        """
+        下载root及其全部依赖的工具文件
+        - run: 下载完成后运行root
+        - run_deps: 先按依赖顺序运行各个依赖,共享的依赖只运行一次
+        """
+        order = self.resolve(root)
+        for id in order: self.download_step(id)
+        if run: self.run_step(root,run_deps)
+        return order
+
+    def _start(self,name,executor):
+        step = self.steps[name]
+        step["start"] = time.time()
+        if step["resource"] in ToolScheduler.inline:
+            self._finish(name,step["fn"])
+            return None
+        return executor.submit(self._finish,name,step["fn"])
+
+    def _finish(self,name,fn):
+        step = self.steps[name]
+        try:
+            step["result"] = fn()!=False
+        except Exception as e:
+            # 在线程池中运行,异常不会再向上抛出,这里保留完整的堆栈
+            step["traceback"] = traceback.format_exc()
+            PrintUtils.print_error("{}运行失败:{}\n{}".format(name,e,step["traceback"]))
+            step["result"] = False
+            step["error"] = str(e)
+        step["end"] = time.time()
+
+    def execute(self):
+        """运行全部步骤,依赖失败的步骤会被跳过,全部成功返回True"""
+        pending = list(self.steps)
+        running = {}
+        workers = sum(limit for resource,limit in self.limits.items() if resource not in ToolScheduler.inline)
+        self.start_time = time.time()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers,1)) as executor:
+            while pending or running:
+                started = False
+                for name in list(pending):
+                    step = self.steps[name]
+                    if any(dep in pending or dep in running.values() for dep in step["deps"]): continue
+                    if any(self.steps[dep]["result"]==False for dep in step["deps"]):
+                        pending.remove(name)
+                        step["result"] = False
+                        PrintUtils.print_warn("{}的依赖失败,已跳过".format(name))
+                        started = True
+                        continue
+                    busy = sum(1 for item in running.values() if self.steps[item]["resource"]==step["resource"])
+                    if busy>=self.limits.get(step["resource"],1): continue
+                    pending.remove(name)
+                    future = self._start(name,executor)
+                    started = True
+                    if future is None: break  # 串行步骤运行期间其他步骤可能已经结束,重新检查
+                    running[future] = name
+                for future in [future for future in running if future.done()]: running.pop(future)
+                if started: continue
+                if len(running)==0: break
+                done,_ = concurrent.futures.wait(list(running),return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done: running.pop(future)
+        for name in pending: self.steps[name]["result"] = False
+        self.end_time = time.time()
+        return all(step["result"]!=False for step in self.steps.values())
+
+    def critical_path(self):
+        """从最后结束的步骤开始,沿着最晚结束的依赖往回找"""
+        done = [name for name,step in self.steps.items() if step["end"]]
+        if len(done)==0: return []
+        path = [max(done,key=lambda name: self.steps[name]["end"])]
+        while True:
+            deps = [dep for dep in self.steps[path[-1]]["deps"] if self.steps[dep]["end"]]
+            if len(deps)==0: break
+            path.append(max(deps,key=lambda name: self.steps[name]["end"]))
+        return path[::-1]
+
+    def summary(self):
+        path = self.critical_path()
+        if len(path)==0: return
+        total = self.end_time-self.start_time
+        busy = sum(self.steps[name]["end"]-self.steps[name]["start"] for name in self.steps if self.steps[name]["end"])
+        PrintUtils.print_info("关键路径耗时(总计{:.1f}s,各步骤累计{:.1f}s):".format(total,busy))
+        for name in path:
+            step = self.steps[name]
+            PrintUtils.print_info("  {:<40} {:>7.1f}s  (开始于+{:.1f}s)".format(name,step["end"]-step["start"],step["start"]-self.start_time))
+
+
 def download_tools(id,tools):
-    # download tool
-    url = tools[id]['tool']
-    os.system("wget {} -O /tmp/fishinstall/tools/{} --no-check-certificate".format(url,url[url.rfind('/')+1:]))
-    # download dep
-    for dep in  tools[id]['dep']:
-        url = tools[dep]['tool']
-        os.system("wget {} -O /tmp/fishinstall/tools/{} --no-check-certificate".format(url,url[url.rfind('/')+1:]))
+    """下载工具及其全部依赖(去重,并行下载)"""
+    scheduler = ToolScheduler(tools)
+    scheduler.plan(id)
+    return scheduler.execute()
 
 
 
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import os
+import glob
+from .base import BaseTool
+from .base import PrintUtils,CmdTask,FileUtils,AptUtils,ChooseTask
+from .base import AptBundle
+from .base import osversion,osarch
+from .base import run_tool_file
+
+class Tool(BaseTool):
+    def __init__(self):
+        self.name = "一键导出/导入ROS离线安装包"
+        self.type = BaseTool.TYPE_INSTALL
+        self.autor = '小鱼'
+
+    def get_bundle_dir(self,rosname):
+        return os.path.join(FileUtils.getusershome()[0],"fishros-bundle-{}-{}".format(rosname,osarch))
+
+    def find_bundles(self):
+        """
+        在用户目录和U盘挂载目录下查找离线包
+        """
+        bundles = []
+        patterns = [home+"fishros-bundle-*" for home in FileUtils.getusershome()]
+        patterns += ["/media/*/*/fishros-bundle-*","/media/*/fishros-bundle-*","/mnt/*/fishros-bundle-*","/mnt/fishros-bundle-*"]
+        for pattern in patterns:
+            for path in sorted(glob.glob(pattern)):
+                if AptBundle(path).manifest() and path not in bundles: bundles.append(path)
+        return bundles
+
+    def export_bundle(self):
+        """
+        导出已安装的ROS版本及其全部依赖
+        """
+        from .tool_install_ros import RosVersions
+        installed = AptBundle.installed_packages()
+        choose = {}
+        for path in sorted(glob.glob("/opt/ros/*/setup.bash")):
+            rosname = path.split("/")[3]
+            if RosVersions.get_version(rosname) is None:
+                # 不在一键安装支持列表中的版本(如手动安装的新版本)不知道桌面版的包名和额外依赖,只按常见包名查找
+                PrintUtils.print_warn("{}不在一键安装ROS的版本列表中,只导出ROS本身,不包含额外依赖".format(rosname))
+                desktops = ["ros-{}-desktop-full".format(rosname),"ros-{}-desktop".format(rosname)]
+            else:
+                desktops = [RosVersions.get_desktop_version(rosname)]
+            for pkg in desktops+["ros-{}-ros-base".format(rosname)]:
+                if pkg in installed:
+                    choose[rosname] = [pkg]
+                    break
+        if len(choose)==0:
+            PrintUtils.print_error("没有找到已经安装的ROS,请先使用[1]一键安装ROS")
+            return False
+        code,rosname = ChooseTask(list(choose.keys()),"请选择要导出的ROS版本:",True,key="bundle.ros_version").run()
+        if code==0: return False
+        # 一键安装ROS时额外安装的依赖也一起导出
+        version = RosVersions.get_version(rosname)
+        deps = version.deps if version is not None else []
+        pkgs = choose[rosname]+[dep for dep in deps if dep in installed]
+        return AptBundle(self.get_bundle_dir(rosname)).export(pkgs)
+
+    def import_bundle(self):
+        """
+        从离线包安装ROS
+        """
+        bundles = self.find_bundles()
+        if len(bundles)==0:
+            PrintUtils.print_error("没有找到离线包,请将导出的fishros-bundle-*目录复制到用户目录或U盘根目录下")
+            return False
+        code,path = ChooseTask(bundles,"请选择要安装的离线包:",True,key="bundle.path").run()
+        if code==0: return False
+        result = AptBundle(path).install()
+        if result is None or result[0]!=0:
+            PrintUtils.print_error("离线包安装失败了,请打开鱼香社区：https://fishros.org.cn/forum 在一键安装专区反馈问题...")
+            return False
+        run_tool_file('tools.tool_config_rosenv')
+        PrintUtils.print_success("离线安装成功了,打开一个新的终端即可使用ROS~")
+        return True
+
+    def run(self):
+        dic = {1:"导出已安装的ROS为离线包(需要先使用一键安装ROS)",2:"从离线包安装ROS(无需网络)"}
+        code,result = ChooseTask(dic, "请选择要进行的操作",key="bundle.action",names={1:"export",2:"import"}).run()
+        if code==1: return self.export_bundle()
+        elif code==2: return self.import_bundle()
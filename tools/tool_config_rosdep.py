@@ -11,7 +11,7 @@ class Tool(BaseTool):
         self.autor = '小鱼'
 
     def install_rosdepc(self):
-        CmdTask("sudo apt install python3-pip -y", 0).run()
+        AptUtils.install_pkgs(['python3-pip'])
         CmdTask("sudo pip3 install -i https://pypi.tuna.tsinghua.edu.cn/simple rosdepc", 0).run()
         CmdTask("sudo rosdepc init", 0).run()
         CmdTask("sudo rosdepc fix-permissions", 0).run()
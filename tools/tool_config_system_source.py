@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
+import re
 from .base import BaseTool
 from .base import PrintUtils,CmdTask,FileUtils,AptUtils,ChooseTask
+from .base import OutputMatcher,apt_freshness,mirror_prober
 from .base import osversion
 from .base import run_tool_file
 
 
 
+# 系统镜像站,各站点下都有ubuntu/ubuntu-ports/debian/debian-security
+system_mirror_dic = {
+    "ustc":"https://mirrors.ustc.edu.cn/",
+    "tuna":"https://mirrors.tuna.tsinghua.edu.cn/",
+    "aliyun":"https://mirrors.aliyun.com/",
+    "huawei":"https://repo.huaweicloud.com/",
+}
+
+
 ros_mirror_dic = {
     "tsinghua":{"ROS1":"http://mirrors.tuna.tsinghua.edu.cn/ros/ubuntu/","ROS2":"http://mirrors.tuna.tsinghua.edu.cn/ros2/ubuntu/"},
     "huawei":{"ROS1":"https://repo.huaweicloud.com/ros/ubuntu/","ROS2":"https://repo.huaweicloud.com/ros2/ubuntu/"},
@@ -69,7 +80,7 @@ class Tool(BaseTool):
     def add_ros_source(self):
         """快速添加ROS源"""
         dic = {1:"添加ROS/ROS2源",2:"不添加ROS/ROS2源"}
-        code,result = ChooseTask(dic, "请问是否添加ROS和ROS2源？").run()
+        code,result = ChooseTask(dic, "请问是否添加ROS和ROS2源？",key="source.add_ros",names={1:"yes",2:"no"}).run()
         if code==2: return
         tool = run_tool_file('tools.tool_install_ros',autorun=False)
         if not tool.support_install(): return False
@@ -78,34 +89,67 @@ class Tool(BaseTool):
         tool.add_source()
 
 
+    def rank_mirrors(self,dist,code,arch,default):
+        """
+        对系统镜像测速,返回按速度排序的镜像名称,都无法访问时default排在第一个
+        """
+        candidates = {}
+        for name,root in system_mirror_dic.items():
+            base = "{}{}/dists/{}/".format(root,dist,code)
+            candidates[name] = (base+"InRelease",base+"main/binary-{}/Packages.gz".format(arch))
+        PrintUtils.print_info("正在对系统镜像测速...")
+        ranked = mirror_prober.rank(candidates)
+        name,score = ranked[0]
+        if not score or not score['ok']: return [default]+[name for name,score in ranked if name!=default]
+        PrintUtils.print_info("选择最快的镜像{}:{},延迟{:.0f}ms".format(name,system_mirror_dic[name],score['latency']*1000))
+        return [name for name,score in ranked]
+
+    def gen_source(self,source,ranked,http=False):
+        """
+        生成sources.list内容
+        - apt支持时,每个<mirror>路径生成一个镜像列表,使用mirror+file:,单个镜像失败时apt自动切换
+        - 否则直接使用最快的镜像
+        """
+        if AptUtils.support_mirror_file():
+            uris = {}
+            for path in set(re.findall(r"<mirror>([\w-]+)",source)):
+                urls = [system_mirror_dic[name]+path+"/" for name in ranked]
+                if http: urls = [url.replace("https://","http://") for url in urls]
+                uris[path] = AptUtils.write_mirror_list(path,urls)
+            source = re.sub(r"<mirror>([\w-]+)/?",lambda m: uris[m.group(1)],source)
+        else:
+            source = source.replace("<mirror>",system_mirror_dic[ranked[0]])
+        if http: source = source.replace("https://","http://")
+        return source.replace("<code-name>",osversion.get_codename())
+
     def change_sys_source(self):
         """
         一键换源
         """
         ports = u"""
-            deb https://mirrors.ustc.edu.cn/ubuntu-ports/ <code-name> main restricted universe multiverse
-            deb https://mirrors.ustc.edu.cn/ubuntu-ports/ <code-name>-updates main restricted universe multiverse
-            deb https://mirrors.ustc.edu.cn/ubuntu-ports/ <code-name>-backports main restricted universe multiverse
-            deb https://mirrors.ustc.edu.cn/ubuntu-ports/ <code-name>-security main restricted universe multiverse
+            deb <mirror>ubuntu-ports/ <code-name> main restricted universe multiverse
+            deb <mirror>ubuntu-ports/ <code-name>-updates main restricted universe multiverse
+            deb <mirror>ubuntu-ports/ <code-name>-backports main restricted universe multiverse
+            deb <mirror>ubuntu-ports/ <code-name>-security main restricted universe multiverse
         """
         normal = """
-            deb https://mirrors.ustc.edu.cn/ubuntu/ <code-name> main restricted universe multiverse
-            deb https://mirrors.ustc.edu.cn/ubuntu/ <code-name>-updates main restricted universe multiverse
-            deb https://mirrors.ustc.edu.cn/ubuntu/ <code-name>-backports main restricted universe multiverse
-            deb https://mirrors.ustc.edu.cn/ubuntu/ <code-name>-security main restricted universe multiverse
+            deb <mirror>ubuntu/ <code-name> main restricted universe multiverse
+            deb <mirror>ubuntu/ <code-name>-updates main restricted universe multiverse
+            deb <mirror>ubuntu/ <code-name>-backports main restricted universe multiverse
+            deb <mirror>ubuntu/ <code-name>-security main restricted universe multiverse
         """
         debian = """
-            deb https://mirrors.tuna.tsinghua.edu.cn/debian/ <code-name> main contrib non-free
-            deb https://mirrors.tuna.tsinghua.edu.cn/debian/ <code-name>-updates main contrib non-free
-            deb https://mirrors.tuna.tsinghua.edu.cn/debian/ <code-name>-backports main contrib non-free
-            deb https://mirrors.tuna.tsinghua.edu.cn/debian-security <code-name>/updates main contrib non-free
+            deb <mirror>debian/ <code-name> main contrib non-free
+            deb <mirror>debian/ <code-name>-updates main contrib non-free
+            deb <mirror>debian/ <code-name>-backports main contrib non-free
+            deb <mirror>debian-security <code-name>/updates main contrib non-free
         """
 
 
         PrintUtils.print_delay('欢迎使用一键换源工具，本工具由[鱼香ROS]小鱼贡献..')
         # delete file
         dic = {1:"仅更换系统源",2:"更换系统源并清理第三方源"}
-        code,result = ChooseTask(dic, "请选择换源方式,如果不知道选什么请选2").run()
+        code,result = ChooseTask(dic, "请选择换源方式,如果不知道选什么请选2",key="source.mode",names={1:"replace",2:"clean"}).run()
         # 尝试第一次更新索引文件
         # result = CmdTask('sudo apt update',100).run()
 
@@ -119,22 +163,24 @@ class Tool(BaseTool):
         # 选择源
         arch = AptUtils.getArch()
         PrintUtils.print_delay('检测到当前系统架构为[{}:{}],正在为你更换对应源..'.format(arch,osversion.get_codename()))
-        source = normal
+        source,dist,mirror = normal,"ubuntu","ustc"
         if osversion.get_name().find("ubuntu")>=0:
-            if arch=='amd64': source = normal
-            else: source = ports
+            if arch=='amd64': source,dist = normal,"ubuntu"
+            else: source,dist = ports,"ubuntu-ports"
         elif osversion.get_name().find("debian")>=0:
-            source = debian
-        FileUtils.new('/etc/apt/','sources.list',source.replace("<code-name>",osversion.get_codename()))
+            source,dist,mirror = debian,"debian","tuna"
+        ranked = self.rank_mirrors(dist,osversion.get_codename(),arch,mirror)
+        FileUtils.new('/etc/apt/','sources.list',self.gen_source(source,ranked))
 
         # update
         PrintUtils.print_delay("替换完成，尝试第一次更新....")
-        result = CmdTask('sudo apt update',100).run()
+        matcher = OutputMatcher.apt(abort_on=['certificate_error'])
+        result = CmdTask('sudo apt update',100,matcher=matcher).run()
         # https error update second
-        if result[0]!= 0 and FileUtils.check_result(result[1]+result[2],['Certificate verification','证书']):
+        if result[0]!= 0 and matcher.has('certificate_error'):
             PrintUtils.print_delay("发生证书错误，尝试第二次更新....")
             FileUtils.delete('/etc/apt/sources.list')
-            FileUtils.new('/etc/apt/','sources.list',source.replace("https://","http://").replace("<code-name>",osversion.get_codename()))
+            FileUtils.new('/etc/apt/','sources.list',self.gen_source(source,ranked,http=True))
             result = CmdTask('sudo apt update',100).run()
         if result[0]!=0:
             PrintUtils.print_info("更新失败，开始更换导入方式并三次尝试...")
@@ -143,7 +189,7 @@ class Tool(BaseTool):
             result = CmdTask("sudo apt-key adv --keyserver keyserver.ubuntu.com --recv-keys 54404762BBB6E853",10).run()
             result = CmdTask("sudo apt-key adv --keyserver keyserver.ubuntu.com --recv-keys F42ED6FBAB17C654",10).run()
             # sudo apt-key adv --keyserver keyserver.ubuntu.com --recv-keys 
-            result = CmdTask("apt-get install debian-keyring debian-archive-keyring",10).run()
+            result = CmdTask("sudo apt-get install debian-keyring debian-archive-keyring -y").run()
             result = CmdTask("apt-key update",10).run()
             result = CmdTask('sudo apt update',100).run()
         if result[0]!=0:
@@ -154,6 +200,7 @@ class Tool(BaseTool):
         
         # final check
         if result[0]==0: 
+            apt_freshness.mark_updated()
             PrintUtils.print_success("搞定了,不信你看,累死宝宝了，还不快去给小鱼点个赞~")
             PrintUtils.print_info(result[1])
 
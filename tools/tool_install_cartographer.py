@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from .base import BaseTool
 from .base import PrintUtils,CmdTask,FileUtils,AptUtils,ChooseTask
+from .base import CmdTaskExecutor
 from .base import osversion,osarch
 from .base import run_tool_file
 import os
@@ -34,11 +35,14 @@ class Tool(BaseTool):
         # check apt
         if not AptUtils.checkapt(): return False
         # 1
-        CmdTask('sudo apt install ninja-build stow git -y').run()
+        AptUtils.install_pkgs(['ninja-build','stow','git'])
         # 2
         CmdTask('mkdir -p cartographer_ws/src').run()
-        CmdTask('git clone https://gitee.com/yuzi99url/cartographer_ros.git',path='cartographer_ws/src').run()
-        CmdTask('git clone https://gitee.com/yuzi99url/cartographer.git',path='cartographer_ws/src').run()
+        # 两个仓库互不依赖,同时克隆
+        executor = CmdTaskExecutor(max_workers=2)
+        executor.submit(CmdTask('git clone https://gitee.com/yuzi99url/cartographer_ros.git',path='cartographer_ws/src'))
+        executor.submit(CmdTask('git clone https://gitee.com/yuzi99url/cartographer.git',path='cartographer_ws/src'))
+        executor.run()
         # 3
         run_tool_file('tools.tool_config_rosdep')
         CmdTask('rosdepc update --include-eol-distros').run()
@@ -28,7 +28,7 @@ class Tool(BaseTool):
         if not AptUtils.checkapt(): return False
 
         #pre-install
-        CmdTask('sudo apt install apt-transport-https ca-certificates curl software-properties-common -y',120).run()
+        AptUtils.install_pkgs(['apt-transport-https','ca-certificates','curl','software-properties-common'])
 
         #add key
         CmdTask('curl -fsSL https://mirrors.ustc.edu.cn/docker-ce/linux/ubuntu/gpg | sudo apt-key add -',10).run()
@@ -48,7 +48,7 @@ class Tool(BaseTool):
         else:
             return False
         PrintUtils.print_info("下载完成,接下来升级apt索引~")
-        CmdTask("sudo apt update").run()
+        AptUtils.checkapt()
         PrintUtils.print_info("开始安装最新版本docker CE~")
         CmdTask("sudo apt --fix-broken install -y").run()
         # CmdTask("sudo apt install docker-ce -y").run()
@@ -11,27 +11,24 @@ class Tool(BaseTool):
         self.autor = '小鱼'
 
     def install_nodejs(self):
-        CmdTask('sudo apt update && sudo apt install git python3-venv -y', os_command=True).run()
+        AptUtils.checkapt()
+        AptUtils.install_pkgs(['git','python3-venv'])
         PrintUtils.print_warn("注意:运行本指令前需要在VS Code 中安装 PlatformIO 插件后再运行本命令")
         user_home = FileUtils.getusershome()[0]
         PrintUtils.print_info("开始安装Platform IO~")
         print(CmdTask('export HOME={} && $HOME.platformio/penv/bin/pip3 install -i https://pypi.tuna.tsinghua.edu.cn/simple platformio'.format(user_home),os_command=True).run())
         PrintUtils.print_info("开始下载ESP32开发依赖库~")
         PrintUtils.print_warn("下载不使用代理会很慢（大约4小时左右），建议运行一键安装14开启代理后，导出终端代理可10分钟装好")
-        PrintUtils.print_info("当前进度: 1/7 ")
-        CmdTask('export HOME={} && $HOME.platformio/penv/bin/pio pkg install --global --platform "platformio/espressif32@^6.4.0"'.format(user_home),os_command=True).run()
-        PrintUtils.print_info("当前进度: 2/7 ")
-        CmdTask('export HOME={} && $HOME.platformio/penv/bin/pio pkg install --global --tool "platformio/contrib-piohome"'.format(user_home), os_command=True).run()
-        PrintUtils.print_info("当前进度: 3/7 ")
-        CmdTask('export HOME={} && $HOME.platformio/penv/bin/pio pkg install --global --tool "platformio/framework-arduinoespressif32"'.format(user_home), os_command=True).run()
-        PrintUtils.print_info("当前进度: 4/7 ")
-        CmdTask('export HOME={} && $HOME.platformio/penv/bin/pio pkg install --global --tool "platformio/tool-scons"'.format(user_home), os_command=True).run()
-        PrintUtils.print_info("当前进度: 5/7 ")
-        CmdTask('export HOME={} && $HOME.platformio/penv/bin/pio pkg install --global --tool "platformio/tool-mkfatfs"'.format(user_home), os_command=True).run()
-        PrintUtils.print_info("当前进度: 6/7 ")
-        CmdTask('export HOME={} && $HOME.platformio/penv/bin/pio pkg install --global --tool "platformio/tool-mkspiffs"'.format(user_home), os_command=True).run()
-        PrintUtils.print_info("当前进度: 7/7 ")
-        CmdTask('export HOME={} && $HOME.platformio/penv/bin/pio pkg install --global --tool "platformio/tool-mklittlefs"'.format(user_home), os_command=True).run()
+        pio = 'export HOME={} && $HOME.platformio/penv/bin/pio pkg install --global '.format(user_home)
+        packages = ['--platform "platformio/espressif32@^6.4.0"',
+                    '--tool "platformio/contrib-piohome"',
+                    '--tool "platformio/framework-arduinoespressif32"',
+                    '--tool "platformio/tool-scons"',
+                    '--tool "platformio/tool-mkfatfs"',
+                    '--tool "platformio/tool-mkspiffs"',
+                    '--tool "platformio/tool-mklittlefs"']
+        # 共用~/.platformio和PlatformIO的包管理锁,不能并发安装,一次pio调用装完全部依赖
+        CmdTask(pio+" ".join(packages)).run()
 
         PrintUtils.print_info("安装,接下来你可以到vscode里新建工程了~!")
 
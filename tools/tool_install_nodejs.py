@@ -14,15 +14,18 @@ class Tool(BaseTool):
         PrintUtils.print_info("开始根据系统架构,为你下载对应版本的nodejs~")
         # 根据系统架构下载不同版本的安装包
         if osarch=='amd64':
-            CmdTask('wget https://npmmirror.com/mirrors/node/v18.12.1/node-v18.12.1-linux-x64.tar.xz -O /tmp/nodejs.tar.xz',os_command=True).run()
+            url = 'https://npmmirror.com/mirrors/node/v18.12.1/node-v18.12.1-linux-x64.tar.xz'
         elif osarch=='arm64':
-            CmdTask('wget https://npmmirror.com/mirrors/node/v18.12.1/node-v18.12.1-linux-arm64.tar.xz -O /tmp/nodejs.tar.xz',os_command=True).run()
+            url = 'https://npmmirror.com/mirrors/node/v18.12.1/node-v18.12.1-linux-arm64.tar.xz'
         else:
             return False
+        # 镜像同时提供了官方的SHASUMS256.txt,用它校验下载的文件
+        if not FileUtils.download(url,'/tmp/nodejs.tar.xz',sha256_url=url.rsplit('/',1)[0]+'/SHASUMS256.txt'):
+            CmdTask('wget {} -O /tmp/nodejs.tar.xz'.format(url),os_command=True).run()
         PrintUtils.print_info("下载完成,接下来为你解压安装Nodejs~")
         CmdTask("rm -rf /opt/nodejs/").run()
         CmdTask("mkdir -p /opt/nodejs/").run()
-        CmdTask("sudo apt install xz-utils -y").run()
+        AptUtils.install_pkgs(['xz-utils'])
         CmdTask("sudo tar -xvf /tmp/nodejs.tar.xz  -C /opt/nodejs/").run()
         CmdTask("sudo chmod -R 777 /opt/nodejs/").run()
         CmdTask("rm -rf /tmp/nodejs.tar.xz").run()
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 from .base import BaseTool
-from .base import PrintUtils,CmdTask,FileUtils,AptUtils,ChooseTask
+from .base import PrintUtils,CmdTask,FileUtils,AptUtils,ChooseTask,InputTask
 from .base import osversion,osarch
 from .base import run_tool_file
 
@@ -76,8 +76,8 @@ class Tool(BaseTool):
         if(result[0]!=0): 
             run_tool_file('tools.tool_install_docker')
         PrintUtils.print_success("================================安装管理工具======================================")
-        CmdTask('sudo docker run -p 1234:80 -d --name yacd --rm ghcr.io/haishanh/yacd:master',os_command=True).run()
-        CmdTask('sudo docker run -p 1234:80 -d --name yacd --rm ghcr.io/haishanh/yacd:master',os_command=True).run()
+        for i in range(2):
+            if CmdTask('sudo docker run -p 1234:80 -d --name yacd --rm ghcr.io/haishanh/yacd:master',tee=True).run()[0]==0: break
 
     def install_proxy_tool(self):
         PrintUtils.print_info("开始根据系统架构,为你下载对应版本的clash~")
@@ -86,7 +86,9 @@ class Tool(BaseTool):
         clash_home = "{}.clash/".format(user_home)
         CmdTask("mkdir -p {}".format(clash_home),os_command=True).run()
         if osarch=='amd64':
-            CmdTask('sudo wget http://github.fishros.org/https://raw.githubusercontent.com/tuomasiy/mlash/main/clash -O {}clash'.format(clash_home),os_command=True).run()
+            url = 'http://github.fishros.org/https://raw.githubusercontent.com/tuomasiy/mlash/main/clash'
+            if not FileUtils.download(url,clash_home+'clash'):
+                CmdTask('sudo wget {} -O {}clash'.format(url,clash_home),os_command=True).run()
         # elif osarch=='arm64':
             # CmdTask('sudo wget http://github.fishros.org/https://github.com/Dreamacro/clash/releases/download/v1.17.0/clash-linux-arm64-v1.17.0.gz -O {}clash.gz'.format(clash_home),os_command=True).run()
         else:
@@ -97,7 +99,7 @@ class Tool(BaseTool):
         CmdTask('sudo chmod a+x {}.clash/clash'.format(user_home),os_command=True).run()
 
         PrintUtils.print_warn("请输入CLASH订阅地址(若无请访问:https://fishros.org.cn/forum/topic/668 获取)")
-        serve_url = input("订阅地址:")
+        serve_url = InputTask("订阅地址:",key="proxy.subscribe_url").run()
 
         
         # docker run -p 1234:80 -d --name yacd --rm ghcr.io/haishanh/yacd:master
@@ -111,7 +113,7 @@ class Tool(BaseTool):
 
         PrintUtils.print_info("==========进行启动项配置...===========")
         dic = {1:"设置开机自启动",2:"不设置开机自启动"}
-        code,result = ChooseTask(dic, "是否设置为开机自启动?").run()
+        code,result = ChooseTask(dic, "是否设置为开机自启动?",key="proxy.autostart",names={1:"yes",2:"no"}).run()
         auto_start_path = "{}.config/autostart/".format(user_home)
         if code==2: FileUtils.delete(auto_start_path+"start_clash.desktop")
         if code==1: 
@@ -120,7 +122,7 @@ class Tool(BaseTool):
 
         PrintUtils.print_info("==========进行桌面快捷方式配置...===========")
         dic = {1:"添加桌面快捷方式",2:"不添加桌面快捷方式"}
-        code,result = ChooseTask(dic, "是否添加桌面快捷方式?").run()
+        code,result = ChooseTask(dic, "是否添加桌面快捷方式?",key="proxy.desktop_shortcut",names={1:"yes",2:"no"}).run()
         if code==1:
             if FileUtils.exists("{}桌面".format(user_home)):
                 desktop_path = "{}桌面/".format(user_home)
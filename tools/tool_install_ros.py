@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 from pickle import NONE
 from .base import BaseTool
-from .base import PrintUtils,CmdTask,FileUtils,AptUtils,ChooseTask
+from .base import PrintUtils,CmdTask,FileUtils,AptUtils,ChooseTask,InputTask
+from .base import install_plan
+from .base import OutputMatcher,apt_transaction,mirror_prober
 from .base import osversion
 from .base import run_tool_file
 
@@ -51,9 +53,8 @@ class RosVersions:
        
     @staticmethod
     def install_depend(name):
-        depends = RosVersions.get_version(name).deps
-        for dep in depends:
-            AptUtils.install_pkg(dep)
+        # 额外依赖先记录下来,由调用方在需要前apt_transaction.commit()一次安装
+        apt_transaction.add(*RosVersions.get_version(name).deps)
 
 
     @staticmethod
@@ -162,14 +163,32 @@ class Tool(BaseTool):
         return mirror
 
 
+    def rank_mirrors(self,code,arch='amd64'):
+        """
+        对当前系统可用的ROS镜像测速,返回按速度排序的镜像名称
+        """
+        version = 'ROS2' if code in ros2_dist_dic.keys() else 'ROS1'
+        dist_dic = ros2_dist_dic if version=='ROS2' else ros_dist_dic
+        if code not in dist_dic.keys(): return []
+        candidates = {}
+        for name in ["tsinghua","huawei","packages.ros","https.packages.ros"]:
+            if name in dist_dic[code]:
+                base = ros_mirror_dic[name][version]
+                candidates[name] = (base+"dists/{}/InRelease".format(code),base+"dists/{}/main/binary-{}/Packages.gz".format(code,arch))
+        PrintUtils.print_info("正在对ROS镜像测速...")
+        ranked = mirror_prober.rank(candidates)
+        for name,score in ranked:
+            if score and score['ok']: PrintUtils.print_info("{}: 延迟{:.0f}ms".format(name,score['latency']*1000))
+            else: PrintUtils.print_info("{}: 无法访问".format(name))
+        return [name for name,score in ranked]
+
     def add_key(self):
         # check apt
         if not AptUtils.checkapt(): 
             pass
             # 检查失败可能会造成后续安装失败
         # pre-install
-        AptUtils.install_pkg('curl')
-        AptUtils.install_pkg('gnupg2')
+        AptUtils.install_pkgs(['curl','gnupg2'])
 
         # add key
         cmd_result = CmdTask("curl -s https://gitee.com/ohhuo/rosdistro/raw/master/ros.asc | sudo apt-key add -",10).run()
@@ -190,13 +209,15 @@ class Tool(BaseTool):
         # 更换系统源
         dic = {1:"更换系统源再继续安装",2:"不更换继续安装"}
         PrintUtils.print_warn("=========接下来这一步很很很很重要，如果不知道怎么选请选择1========")
-        code,result = ChooseTask(dic, "新手或首次安装一定要一定要一定要换源并清理三方源，换源!!!系统默认国外源容易失败!!").run()
+        code,result = ChooseTask(dic, "新手或首次安装一定要一定要一定要换源并清理三方源，换源!!!系统默认国外源容易失败!!",key="ros.change_source",names={1:"yes",2:"no"}).run()
         if code==1: 
             tool = run_tool_file('tools.tool_config_system_source',autorun=False)
             tool.change_sys_source()
 
-    def get_all_instsll_ros_pkgs(self):
-        AptUtils.checkapt()
+    def get_all_instsll_ros_pkgs(self,update_timeout=60):
+        # 换源尝试时限制更新时间，卡住的镜像尽快交给下一个源
+        # 更新失败时不能相信本地的旧列表
+        if not AptUtils.checkapt(timeout=update_timeout,force=True): return None
         dic_base = AptUtils.search_package('ros-base','ros-[A-Za-z]+-ros-base',"ros-","-base")
         if dic_base== None: return None
         ros_name = {}
@@ -214,63 +235,43 @@ class Tool(BaseTool):
         arch = AptUtils.getArch()
         if arch==None: return False
 
-        #add source 1
-        mirrors = self.get_mirror_by_code(osversion.get_codename(),arch=arch)
-        PrintUtils.print_info("根据您的系统，为您推荐安装源为{}".format(mirrors))
-        source_data = ''
-        for mirror in mirrors:
-            source_data += 'deb [arch={}]  {} {} main\n'.format(arch,mirror,osversion.get_codename())
-        FileUtils.delete('/etc/apt/sources.list.d/ros-fish.list')
-        FileUtils.new('/etc/apt/sources.list.d/',"ros-fish.list",source_data)
-
-        ros_pkg = self.get_all_instsll_ros_pkgs()
-        if ros_pkg and len(ros_pkg)>1:
-            PrintUtils.print_success("恭喜，成功添加ROS源，接下来可以使用apt安装ROS或者使用[1]一键安装ROS安装！") 
-            return
-        
-        #add source2 
-        PrintUtils.print_warn("换源后更新失败，第二次开始切换源，尝试更换ROS2源为华为源！") 
-        mirrors = self.get_mirror_by_code(osversion.get_codename(),arch=arch,first_choose="huawei")
-        PrintUtils.print_info("根据您的系统，为您推荐安装源为{}".format(mirrors))
-        source_data = ''
-        for mirror in mirrors:
-            source_data += 'deb [arch={}]  {} {} main\n'.format(arch,mirror,osversion.get_codename())
-        FileUtils.delete('/etc/apt/sources.list.d/ros-fish.list')
-        FileUtils.new('/etc/apt/sources.list.d/',"ros-fish.list",source_data)
-        ros_pkg = self.get_all_instsll_ros_pkgs()
-        if ros_pkg and len(ros_pkg)>1:
-            PrintUtils.print_success("恭喜，成功添加ROS源，接下来可以使用apt安装ROS或者使用[1]一键安装ROS安装！") 
-            return
-
-        #add source2 
-        PrintUtils.print_warn("换源后更新失败，第三次开始切换源，尝试更换ROS2源为ROS2官方源！") 
-        mirrors = self.get_mirror_by_code(osversion.get_codename(),arch=arch,first_choose="packages.ros")
-        PrintUtils.print_info("根据您的系统，为您推荐安装源为{}".format(mirrors))
-        source_data = ''
-        for mirror in mirrors:
-            source_data += 'deb [arch={}]  {} {} main\n'.format(arch,mirror,osversion.get_codename())
-        FileUtils.delete('/etc/apt/sources.list.d/ros-fish.list')
-        FileUtils.new('/etc/apt/sources.list.d/',"ros-fish.list",source_data)
-        ros_pkg = self.get_all_instsll_ros_pkgs()
-        if ros_pkg and len(ros_pkg)>1:
-            PrintUtils.print_success("恭喜，成功添加ROS源，接下来可以使用apt安装ROS或者使用[1]一键安装ROS安装！") 
-            return
-
-        PrintUtils.print_warn("换源后更新失败，第四次开始切换源，尝试使用https-ROS2官方源～！") 
-        mirrors = self.get_mirror_by_code(osversion.get_codename(),arch=arch,first_choose="https.packages.ros")
-        PrintUtils.print_info("根据您的系统，为您推荐安装源为{}".format(mirrors))
-        source_data = ''
-        for mirror in mirrors:
-            source_data += 'deb [arch={}]  {} {} main\n'.format(arch,mirror,osversion.get_codename())
-        FileUtils.delete('/etc/apt/sources.list.d/ros-fish.list')
-        FileUtils.new('/etc/apt/sources.list.d/',"ros-fish.list",source_data)
-        ros_pkg = self.get_all_instsll_ros_pkgs()
-        if ros_pkg and len(ros_pkg)>1:
-            PrintUtils.print_success("恭喜，成功添加ROS源，接下来可以使用apt安装ROS或者使用[1]一键安装ROS安装！") 
-            return
+        code = osversion.get_codename()
+        ranked = self.rank_mirrors(code,arch=arch)
+        # 使用镜像列表,apt在一次更新中自动切换镜像
+        if AptUtils.support_mirror_file():
+            source_data = ''
+            for version,dist_dic in (('ROS1',ros_dist_dic),('ROS2',ros2_dist_dic)):
+                if code not in dist_dic.keys(): continue
+                urls = [ros_mirror_dic[name][version] for name in ranked if name in dist_dic[code]]
+                # armhf架构，优先使用官方源
+                if arch=='armhf' and version=='ROS2': urls.sort(key=lambda url: url!=ros_mirror_dic['packages.ros'][version])
+                source_data += 'deb [arch={}]  {} {} main\n'.format(arch,AptUtils.write_mirror_list("ros-"+version.lower(),urls),code)
+            PrintUtils.print_info("根据您的系统，为您生成镜像列表{}".format(AptUtils.mirror_list_dir))
+            FileUtils.delete('/etc/apt/sources.list.d/ros-fish.list')
+            FileUtils.new('/etc/apt/sources.list.d/',"ros-fish.list",source_data)
+            ros_pkg = self.get_all_instsll_ros_pkgs()
+            if ros_pkg and len(ros_pkg)>1:
+                PrintUtils.print_success("恭喜，成功添加ROS源，接下来可以使用apt安装ROS或者使用[1]一键安装ROS安装！") 
+                return
+            PrintUtils.print_warn("使用镜像列表更新失败，开始逐个尝试镜像！")
+
+        # 按测速结果依次尝试镜像
+        for i,first_choose in enumerate(ranked):
+            if i>0: PrintUtils.print_warn("换源后更新失败，第{}次开始切换源，尝试更换源为{}！".format(i+1,first_choose))
+            mirrors = self.get_mirror_by_code(code,arch=arch,first_choose=first_choose)
+            PrintUtils.print_info("根据您的系统，为您推荐安装源为{}".format(mirrors))
+            source_data = ''
+            for mirror in mirrors:
+                source_data += 'deb [arch={}]  {} {} main\n'.format(arch,mirror,code)
+            FileUtils.delete('/etc/apt/sources.list.d/ros-fish.list')
+            FileUtils.new('/etc/apt/sources.list.d/',"ros-fish.list",source_data)
+            ros_pkg = self.get_all_instsll_ros_pkgs()
+            if ros_pkg and len(ros_pkg)>1:
+                PrintUtils.print_success("恭喜，成功添加ROS源，接下来可以使用apt安装ROS或者使用[1]一键安装ROS安装！") 
+                return
 
         # echo >>/etc/apt/apt.conf.d/99verify-peer.conf "Acquire { https::Verify-Peer false }"
-        if  not AptUtils.checkapt(): PrintUtils.print_error("四次换源后都失败了，请及时联系小鱼获取解决方案并处理！") 
+        if  not AptUtils.checkapt(force=True): PrintUtils.print_error("多次换源后都失败了，请及时联系小鱼获取解决方案并处理！") 
 
 
 
@@ -302,12 +303,12 @@ class Tool(BaseTool):
         for a in dic_base.keys(): 
             ros_name[RosVersions.get_version_string(a)] = a
 
-        code,rosname = ChooseTask(ros_name.keys(),"请选择你要安装的ROS版本名称(请注意ROS1和ROS2区别):",True).run()
+        code,rosname = ChooseTask(ros_name.keys(),"请选择你要安装的ROS版本名称(请注意ROS1和ROS2区别):",True,key="ros.version").run()
         if code==0: 
             PrintUtils.print_error("你选择退出。。。。")
             return
         version_dic = {1:rosname+"桌面版",2:rosname+"基础版(小)"}
-        code,name = ChooseTask(version_dic,"请选择安装的具体版本(如果不知道怎么选,请选1桌面版):",False).run()
+        code,name = ChooseTask(version_dic,"请选择安装的具体版本(如果不知道怎么选,请选1桌面版):",False,key="ros.flavor",names={1:"desktop",2:"base"}).run()
         
         if code==0: 
             print("你选择退出。。。。")
@@ -321,43 +322,32 @@ class Tool(BaseTool):
         install_version = ros_name[rosname]
 
         if install_tool=='aptitude':
-            AptUtils.install_pkg('aptitude')
-            AptUtils.install_pkg('aptitude')
+            AptUtils.install_pkgs(['aptitude'])
 
         # 先尝试使用apt 安装，之后再使用aptitude。
-        if code==2:
-            # 第一次尝试
-            cmd_result = CmdTask("sudo {} install  {} -y".format(install_tool_apt,dic_base[install_version]),300,os_command=True).run()
-            cmd_result = CmdTask("sudo {} install  {} -y".format(install_tool_apt,dic_base[install_version]),300,os_command=False).run()
-            if FileUtils.check_result(cmd_result,['未满足的依赖关系','unmet dependencies','but it is not installable']):
-                # 尝试使用aptitude解决依赖问题
-                PrintUtils.print_warn("============================================================")
-                PrintUtils.print_delay("请注意我，检测你在安装过程中出现依赖问题，请在稍后输入n,再选择y,即可解决")
-                import time
-                input("确认了解情况，请输入回车继续安装")
-                cmd_result = CmdTask("sudo {} install   {} ".format(install_tool,install_version),300,os_command=True).run()
-                cmd_result = CmdTask("sudo {} install   {} -y".format(install_tool,dic_base[install_version]),300,os_command=False).run()
-        
-        elif code==1:
-            cmd_result = CmdTask("sudo {} install   {} -y".format(install_tool_apt,RosVersions.get_desktop_version(install_version)),300,os_command=True).run()
-            cmd_result = CmdTask("sudo {} install   {} -y".format(install_tool_apt,RosVersions.get_desktop_version(install_version)),300,os_command=False).run()
-            if FileUtils.check_result(cmd_result,['未满足的依赖关系','unmet dependencies','but it is not installable']):
-                # 尝试使用aptitude解决依赖问题
-                PrintUtils.print_warn("============================================================")
-                PrintUtils.print_delay("请注意我，检测你在安装过程中出现依赖问题，请在稍后输入n,再选择y,即可解决（若无法解决，清在稍后手动运行命令: sudo aptitude install {})".format(RosVersions.get_desktop_version(install_version)))
-                import time
-                input("确认了解情况，请输入回车继续安装")
-                cmd_result = CmdTask("sudo {} install   {}".format(install_tool,RosVersions.get_desktop_version(install_version)),300,os_command=True).run()
-                cmd_result = CmdTask("sudo {} install   {} -y".format(install_tool,RosVersions.get_desktop_version(install_version)),300,os_command=False).run()
+        # tee模式实时显示输出并且可以交互,同时记录输出,每次安装只运行一次
+        if code==2: install_pkg = dic_base[install_version]
+        elif code==1: install_pkg = RosVersions.get_desktop_version(install_version)
+        matcher = OutputMatcher.apt(abort_on=['unmet_dependency'])
+        cmd_result = CmdTask("sudo {} install   {} -y".format(install_tool_apt,install_pkg),0,tee=True,matcher=matcher).run()
+        if matcher.has('unmet_dependency'):
+            # aptitude需要手动选择解决方案
+            install_plan.require_interactive("aptitude解决{}的依赖问题".format(install_pkg))
+            # 尝试使用aptitude解决依赖问题
+            PrintUtils.print_warn("============================================================")
+            PrintUtils.print_delay("请注意我，检测你在安装过程中出现依赖问题，请在稍后输入n,再选择y,即可解决（若无法解决，清在稍后手动运行命令: sudo aptitude install {})".format(install_pkg))
+            InputTask("确认了解情况，请输入回车继续安装",key="apt.aptitude_confirm").run()
+            matcher = OutputMatcher.apt()
+            cmd_result = CmdTask("sudo {} install   {}".format(install_tool,install_pkg),0,tee=True,matcher=matcher).run()
 
         # apt broken error
         if cmd_result[0]!=0:
-            if FileUtils.check_result(cmd_result[1]+cmd_result[2],['sudo apt --fix-broken install -y']):
-                if code==2: cmd_result = CmdTask("sudo {} install   {} -y".formatinstall_tool,(dic_base[rosname]),300,os_command=False).run()
-                elif code==1: cmd_result = CmdTask("sudo {} install   {} -y".format(install_tool,rosname),300,os_command=False).run()
+            if matcher.has('fix_broken'):
+                cmd_result = CmdTask("sudo {} install   {} -y".format(install_tool,install_pkg),0).run()
 
-        # 安装额外的依赖
+        # 安装额外的依赖,后面配置环境时就要用到,这里一次提交
         RosVersions.install_depend(install_version)
+        apt_transaction.commit()
 
         return install_version
 
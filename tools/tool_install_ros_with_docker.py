@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
+import re
 from .base import BaseTool
-from .base import PrintUtils,CmdTask,FileUtils,AptUtils,ChooseTask
+from .base import PrintUtils,CmdTask,FileUtils,AptUtils,ChooseTask,InputTask
 from .base import osversion,osarch
-from .base import run_tool_file
+from .base import run_tool_file,apt_transaction
 
 class RosVersion:
     STATUS_EOL = 0
@@ -60,9 +61,7 @@ class RosVersions:
 
     @staticmethod
     def install_depend(name):
-        depends = RosVersions.get_version(name).deps
-        for dep in depends:
-            AptUtils.install_pkg(dep)
+        apt_transaction.add(*RosVersions.get_version(name).deps)
 
 
     @staticmethod
@@ -123,7 +122,7 @@ newgrp docker
     def choose_image_version(self):
         """获取要安装的ROS版本"""
         PrintUtils.print_success("================================1.版本选择======================================")
-        code,rosname = ChooseTask(RosVersions.get_vesion_list(),"请选择你要安装的ROS版本名称(请注意ROS1和ROS2区别):",True).run()
+        code,rosname = ChooseTask(RosVersions.get_vesion_list(),"请选择你要安装的ROS版本名称(请注意ROS1和ROS2区别):",True,key="ros.version").run()
         if code==0: 
             PrintUtils.print_error("你选择退出。。。。")
             return 
@@ -142,9 +141,9 @@ newgrp docker
     def download_image(self,name):
         """"""
         PrintUtils.print_success("=================3.下载镜像（该步骤因网络原因会慢一些，若失败请重试）==================")
-        CmdTask('sudo docker pull {} '.format(RosVersions.get_image(name)),os_command=True).run()
-        CmdTask('sudo docker pull {} '.format(RosVersions.get_image(name)),os_command=True).run()
-        CmdTask('sudo docker pull {} '.format(RosVersions.get_image(name)),os_command=True).run()
+        # 拉取失败时重试,成功后不再重复拉取
+        for i in range(3):
+            if CmdTask('sudo docker pull {} '.format(RosVersions.get_image(name)),tee=True).run()[0]==0: break
 
         # create image
         # TODO 更换好系统源
@@ -157,12 +156,11 @@ newgrp docker
         """创建容器"""
         PrintUtils.print_success("================================4.生成容器======================================")
         # get a name
-        PrintUtils.print_warn("请为你的{}容器取个名字吧！".format(name))
-        container_name = input(">>")
+        PrintUtils.print_warn("请为你的{}容器取个名字吧！(字母、数字、_.-组成)".format(name))
+        # docker容器名的规则,空名字或者不合法时重新输入
+        container_name = InputTask(">>",key="docker.container_name",
+                                   validate=lambda value: re.match(r"^[a-zA-Z0-9][a-zA-Z0-9_.-]*$",value) is not None).run()
         PrintUtils.print_info("收到名字{}".format(container_name))
-        while not container_name:
-            PrintUtils.print_warn("请为你的{}容器取个名字吧！".format(name))
-            container_name = input(">>")
 
         # get home
         user =  FileUtils.getusers()[0]
@@ -215,14 +213,14 @@ newgrp docker
         """安装后续使用工具"""
         PrintUtils.print_success("================================6.生成使用工具======================================")
         tool_dic = {1:"套餐1:VsCode+插件（本地使用推荐）",2:"套餐2:SSH-Service（远程使用推荐）"}
-        code,name = ChooseTask(tool_dic,"为方便后续使用容器，请选择使用方式，若不知道怎么选，推荐套餐1,若不需要则可以选退出:",False).run()
+        code,name = ChooseTask(tool_dic,"为方便后续使用容器，请选择使用方式，若不知道怎么选，推荐套餐1,若不需要则可以选退出:",False,key="docker.use_tool",names={1:"vscode",2:"ssh"}).run()
         if code==1:
             PrintUtils.print_info("套餐1包含Vscode及其容器插件，开始安装。。")
             run_tool_file('tools.tool_install_vscode')
             CmdTask('code --install-extension ms-vscode-remote.remote-containers --user-data-dir',os_command=True).run()
         elif code==2:
-            CmdTask('sudo apt update',os_command=True).run()
-            CmdTask('sudo apt install openssh-server -y',os_command=True).run()
+            AptUtils.checkapt()
+            AptUtils.install_pkgs(['openssh-server'])
             CmdTask('service ssh start',os_command=True).run()
         return 
 
@@ -17,11 +17,13 @@ class Tool(BaseTool):
         PrintUtils.print_info("开始根据系统架构,为你下载对应版本的vscode~")
         # 根据系统架构下载不同版本的安装包
         if osarch=='amd64':
-            CmdTask('sudo wget http://vscode.cdn.azure.cn/stable/abd2f3db4bdb28f9e95536dfa84d8479f1eb312d/code_1.82.2-1694671812_amd64.deb -O /tmp/vscode.deb',os_command=True).run()
+            url = 'http://vscode.cdn.azure.cn/stable/abd2f3db4bdb28f9e95536dfa84d8479f1eb312d/code_1.82.2-1694671812_amd64.deb'
         elif osarch=='arm64':
-            CmdTask('sudo wget http://vscode.cdn.azure.cn/stable/abd2f3db4bdb28f9e95536dfa84d8479f1eb312d/code_1.82.2-1694671436_arm64.deb -O /tmp/vscode.deb',os_command=True).run()
+            url = 'http://vscode.cdn.azure.cn/stable/abd2f3db4bdb28f9e95536dfa84d8479f1eb312d/code_1.82.2-1694671436_arm64.deb'
         else:
             return False
+        if not FileUtils.download(url,'/tmp/vscode.deb'):
+            CmdTask('sudo wget {} -O /tmp/vscode.deb'.format(url),os_command=True).run()
         PrintUtils.print_info("下载完成,接下来为你安装Vscode~")
         CmdTask("sudo dpkg -i /tmp/vscode.deb").run()
         CmdTask("rm -rf /tmp/vscode.deb").run()
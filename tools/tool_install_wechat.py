@@ -38,19 +38,20 @@ newgrp docker
 
         """
         wechat_version_dic = {1:"Docker版本",2:"桌面版本(v2.1.1)",3:"推荐:wine版本(v3.0.0)",4:"一键清理"}
-        code,_ = ChooseTask(wechat_version_dic,"请选择微信版本(两个版本区别对比:https://fishros.org.cn/forum/topic/195):",False).run()
+        code,_ = ChooseTask(wechat_version_dic,"请选择微信版本(两个版本区别对比:https://fishros.org.cn/forum/topic/195):",False,key="wechat.version",names={1:"docker",2:"desktop",3:"wine",4:"clean"}).run()
         if code==2:
             AptUtils.install_pkg("git")
-            CmdTask('sudo apt install git',os_command=True).run()
             CmdTask('git clone https://gitee.com/ohhuo/wechat_deb.git /tmp/wechat_deb',os_command=True).run()
             CmdTask('cd /tmp/wechat_deb && cat wechat_* > wechat.deb',os_command=True).run()
             CmdTask('cd /tmp/wechat_deb && sudo dpkg -i wechat.deb',os_command=True).run()
             CmdTask('rm -rf /tmp/wechat_deb',os_command=True).run()
             PrintUtils.print_success("已为你安装完成wechat~")
         if code==3:
-            CmdTask('wget http://archive.ubuntukylin.com/software/pool/partner/ukylin-wine_70.6.3.25_amd64.deb -O /tmp/ukylin-wine_70.6.3.25_amd64.deb',os_command=True).run()
-            CmdTask('wget http://archive.ubuntukylin.com/software/pool/partner/ukylin-wechat_3.0.0_amd64.deb -O /tmp/ukylin-wechat_3.0.0_amd64.deb',os_command=True).run()
-            CmdTask('sudo apt install xdotool',os_command=True).run()
+            for deb in ['ukylin-wine_70.6.3.25_amd64.deb','ukylin-wechat_3.0.0_amd64.deb']:
+                url = 'http://archive.ubuntukylin.com/software/pool/partner/'+deb
+                if not FileUtils.download(url,'/tmp/'+deb):
+                    CmdTask('wget {} -O /tmp/{}'.format(url,deb),os_command=True).run()
+            AptUtils.install_pkgs(['xdotool'])
             CmdTask('sudo dpkg -i /tmp/ukylin-wine_70.6.3.25_amd64.deb',os_command=True).run()
             CmdTask('sudo dpkg -i /tmp/ukylin-wechat_3.0.0_amd64.deb',os_command=True).run()
             CmdTask('apt --fix-broken install -y',os_command=True).run()
@@ -64,13 +65,13 @@ newgrp docker
             bin_path = "/home/{}/.fishros/bin/".format(user)
             home = "/home/{}".format(user)
             version_dic = {1:"ibus(系统默认)",2:"fcitx"}
-            code,_ = ChooseTask(version_dic,"请选择系统输入法版本(如果不知道怎么选,请选1-ibus):",False).run()
+            code,_ = ChooseTask(version_dic,"请选择系统输入法版本(如果不知道怎么选,请选1-ibus):",False,key="wechat.input_method",names={1:"ibus",2:"fcitx"}).run()
             if code == 1: inputs='ibus'
             file_path = '/home/{}/.WeChatFiles'.format(user,name)
             CmdTask('mkdir -p {}'.format(file_path),os_command=True).run()
             PrintUtils.print_info("正在为您拉取微信镜像")
-            CmdTask('sudo docker pull bestwu/wechat ',os_command=True).run()
-            CmdTask('sudo docker pull bestwu/wechat ',os_command=True).run()
+            for i in range(2):
+                if CmdTask('sudo docker pull bestwu/wechat ',tee=True).run()[0]==0: break
             PrintUtils.print_info("正在为创建安装微信")
             build = 'sudo docker run -d --name wechat --device /dev/snd --ipc="host"  -v /tmp/.X11-unix:/tmp/.X11-unix  \
             -v {}:/WeChatFiles  -v {}:/home/wechat -e DISPLAY=unix$DISPLAY  -e XMODIFIERS=@im={}  -e QT_IM_MODULE={}  -e GTK_IM_MODULE={}  -e AUDIO_GID=`getent group audio | cut -d: -f3` bestwu/wechat'.format(file_path,home,inputs,inputs,inputs)